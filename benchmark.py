@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from time import perf_counter
+# pygame draws into memory rather than a window, so no display is needed
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+import numpy as np
+import pygame
+import maze2D_core
+import maze3D
+import maze3D_core
+
+# Sizes timed for each generator, and the smaller ones used by --quick
+MAZE2D_SIZES = [(10, 10), (50, 50), (100, 100), (200, 200)]
+MAZE3D_SIZES = [(3, 3, 3), (5, 5, 5), (10, 10, 10), (20, 20, 20)]
+QUICK_MAZE2D_SIZES = [(10, 10), (50, 50)]
+QUICK_MAZE3D_SIZES = [(3, 3, 3), (5, 5, 5)]
+MAZE2D_METHODS = ["grow", "percolate", "eller"]
+SEED = 0
+LATENCY_PERCENTILES = [50, 90, 99]
+
+
+class HeldKeys(object):
+    """
+    Stands in for pygame.key.get_pressed(), with the keys named by names
+    (see maze3D.TRACE_KEYS) held down.
+    """
+    def __init__(self, names):
+        self.keys = {maze3D.TRACE_KEYS[name] for name in names}
+
+    def __getitem__(self, key):
+        return key in self.keys
+
+
+def default_trace():
+    """
+    A fixed trace of moving about, turning and looking around, as a list of
+    the keys held down at each simulation step.
+    """
+    trace = []
+    for names, steps in [(["up"], 120), (["a"], 60), (["up"], 90), (["up", "d"], 60), (["w"], 30),
+                         (["s", "q"], 60), (["down"], 60), (["e"], 45), (["up", "a"], 120), ([], 10)]:
+        trace.extend([names] * steps)
+    return trace
+
+
+def time_call(function, repeat):
+    """
+    :return: the shortest and the mean time in seconds taken by function()
+    over repeat calls
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times), sum(times) / len(times)
+
+
+def benchmark_generation(maze2D_sizes, maze3D_sizes, repeat):
+    results = []
+
+    def record(generator, size, function):
+        # Seed before every call so each run builds the same maze
+        def seeded():
+            random.seed(SEED)
+            function()
+        best, mean = time_call(seeded, repeat)
+        results.append({"generator": generator, "size": list(size), "seed": SEED,
+                        "best_seconds": best, "mean_seconds": mean})
+
+    for width, height in maze2D_sizes:
+        for method in MAZE2D_METHODS:
+            record(method + "_maze", (width, height),
+                   lambda: maze2D_core.generate_maze(width, height, method))
+    for width, height, depth in maze3D_sizes:
+        record("procedurally_generated_maze", (width, height, depth),
+               lambda: maze3D_core.procedurally_generated_maze(width, height, depth, False))
+    return results
+
+
+def replay(maze, trace, depth_buffer):
+    """
+    Plays a trace through the game's simulation and drawing, one frame per
+    simulation step, as play_maze would with frames drawn straight away.
+    :return: the number of frames drawn, the total time and the time
+    between reading the input and finishing the frame for each frame drawn
+    """
+    surface = pygame.Surface((maze3D.SCREEN_WIDTH, maze3D.SCREEN_HEIGHT))
+    profiler = maze3D_core.FrameProfiler()
+    latencies = []
+    start = perf_counter()
+    for names in trace:
+        frame_start = perf_counter()
+        version = maze.camera.version
+        if maze3D.simulate(maze, HeldKeys(names), profiler):
+            break
+        if maze.camera.version != version:
+            maze3D.draw_frame(surface, maze, profiler, depth_buffer)
+            latencies.append(perf_counter() - frame_start)
+    return len(latencies), perf_counter() - start, latencies
+
+
+def benchmark_replay(traces, maze_size):
+    pygame.init()
+    results = []
+    for trace_name, trace in traces:
+        for maze_name in ["predefined", "random"]:
+            for renderer, depth_buffer in [("painter", False), ("depth_buffer", True)]:
+                random.seed(SEED)
+                if maze_name == "predefined":
+                    maze = maze3D_core.predefined_maze()
+                else:
+                    maze = maze3D_core.procedurally_generated_maze(*maze_size, False, True)
+                frames, seconds, latencies = replay(maze, trace, depth_buffer)
+                latencies_ms = 1000 * np.array(latencies) if latencies else np.zeros(1)
+                result = {"trace": trace_name, "maze": maze_name, "renderer": renderer, "frames": frames,
+                          "seconds": seconds, "fps": frames / seconds if seconds else 0.0,
+                          "latency_ms": {"p{}".format(percentile): float(np.percentile(latencies_ms, percentile))
+                                         for percentile in LATENCY_PERCENTILES}}
+                result["latency_ms"]["max"] = float(latencies_ms.max())
+                if maze_name == "random":
+                    result["size"] = list(maze_size)
+                results.append(result)
+    pygame.quit()
+    return results
+
+
+def record_trace(path, maze_size):
+    """
+    Plays a random maze in a real window, and saves the keys held down at
+    each step to path
+    """
+    del os.environ["SDL_VIDEODRIVER"]
+    random.seed(SEED)
+    trace = []
+    maze3D.play_maze(maze3D_core.procedurally_generated_maze(*maze_size, False, True), trace)
+    with open(path, "w") as file:
+        json.dump(trace, file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Times maze generation and replays recorded games of the "
+                                                 "3D maze without a display, writing the results as JSON.")
+    parser.add_argument("--output", help="file to write the results to, instead of the standard output")
+    parser.add_argument("--repeat", type=int, default=3, help="number of times to time each generator")
+    parser.add_argument("--quick", action="store_true", help="only use small mazes")
+    parser.add_argument("--trace", action="append", default=[],
+                        help="JSON file of keys held down at each step, as saved by --record, to replay. "
+                             "A built-in trace is replayed if none is given.")
+    parser.add_argument("--record", help="play a game in a window and save its trace to this file")
+    arguments = parser.parse_args()
+    maze_size = (5, 5, 5) if arguments.quick else (8, 8, 8)
+    if arguments.record:
+        record_trace(arguments.record, maze_size)
+        return
+
+    traces = []
+    for path in arguments.trace:
+        with open(path) as file:
+            traces.append((path, json.load(file)))
+    if not traces:
+        traces.append(("default", default_trace()))
+    results = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pygame": pygame.version.ver,
+        "generation": benchmark_generation(QUICK_MAZE2D_SIZES if arguments.quick else MAZE2D_SIZES,
+                                           QUICK_MAZE3D_SIZES if arguments.quick else MAZE3D_SIZES,
+                                           arguments.repeat),
+        "replay": benchmark_replay(traces, maze_size),
+    }
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
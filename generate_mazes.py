@@ -0,0 +1,175 @@
+import argparse
+import os
+import random
+import re
+import struct
+import sys
+from multiprocessing import Pool
+from time import perf_counter
+import numpy as np
+import maze2D_core
+import maze3D_core
+import maze_files
+
+# Mazes are written in shards of SHARD_SIZE mazes each, one file per shard
+SHARD_SIZE = 1000
+SHARD_NAME = "mazes-{:06d}.maze"
+SHARD_PATTERN = re.compile(r"mazes-(\d+)\.maze")
+METHODS = ["grow", "percolate", "eller", "3d"]
+# Name of the generator saved in the header of 3D mazes
+GENERATOR_3D = "procedural"
+
+
+def shard_seed(seed, shard):
+    """
+    The seed for a shard, which depends only on the seed of the whole run and
+    the number of the shard, so that a shard comes out the same whichever
+    worker generates it and whenever it is generated.
+    """
+    return int(np.random.SeedSequence([seed, shard]).generate_state(1, np.uint64)[0])
+
+
+def maze_seeds(seed):
+    """
+    Yields the seeds of the mazes in the shard with the given seed. They
+    come from their own generator, since the global one is reseeded for
+    every maze.
+    """
+    seeds = random.Random(seed)
+    while True:
+        yield seeds.getrandbits(63)
+
+
+def generate_shard(task):
+    """
+    Generates one shard of mazes and writes them one after another to its
+    file. The mazes are written by the worker that made them, so only the
+    path goes back to the main process rather than the walls themselves.
+    The file is written under a temporary name and renamed once complete,
+    so an interrupted run never leaves a partial shard behind.
+    :param task: tuple of the path, the number of mazes, the method, the
+    dimensions of the mazes and the seed of the shard
+    :return: the path and the number of mazes written
+    """
+    path, count, method, dimensions, seed = task
+    temporary_path = path + ".part"
+    with open(temporary_path, "wb") as file:
+        for _, maze_seed in zip(range(count), maze_seeds(seed)):
+            # Each maze is seeded on its own, with the seed saved in its
+            # header, so any one maze can be generated again from it
+            random.seed(maze_seed)
+            if method == "3d":
+                layout = maze3D_core.procedurally_generated_layout(*dimensions, False, True)
+                maze_files.write_maze3D(file, *layout, generator=GENERATOR_3D, seed=maze_seed)
+            else:
+                wall, goal_position, player_position = maze2D_core.generate_maze(*dimensions, method)
+                maze_files.write_maze2D(file, wall, goal_position, player_position, method, maze_seed)
+    os.replace(temporary_path, path)
+    return path, count
+
+
+def shard_complete(path, count, method, dimensions, seed):
+    """
+    Checks a shard left by an earlier run against the one that would be
+    generated now.
+    :return: True if it holds the count mazes it should, and False if it
+    holds a different number of them, for example because the number of
+    mazes in the run has changed
+    :raise ValueError: if it holds mazes from a run with other settings
+    """
+    generator = GENERATOR_3D if method == "3d" else method
+    dimensions = tuple(dimensions) + (1,) * (3 - len(dimensions))
+    try:
+        with maze_files.map_file(path) as buffer:
+            headers = [maze_files.read_header(buffer, offset) for offset in maze_files.maze_offsets(buffer)]
+    except (ValueError, struct.error):
+        raise ValueError("{} is not a maze file".format(path))
+    for header, maze_seed in zip(headers, maze_seeds(seed)):
+        if (header.dimensions, header.generator, header.seed) != (dimensions, generator, maze_seed):
+            raise ValueError("{} holds mazes from a run with a different method, size or seed".format(path))
+    return len(headers) == count
+
+
+def shard_tasks(directory, count, method, dimensions, seed, shard_size=SHARD_SIZE):
+    """
+    Splits count mazes into shards, leaving out those already in directory
+    from an earlier run. Shards with the wrong number of mazes are
+    generated again.
+    :return: a list of tasks for generate_shard, and the number of mazes
+    already written
+    :raise ValueError: if directory holds shards from a run with other
+    settings, or more shards than count mazes need
+    """
+    needed_shards = -(-count // shard_size)
+    for name in sorted(os.listdir(directory)):
+        match = SHARD_PATTERN.fullmatch(name)
+        if match and int(match.group(1)) >= needed_shards:
+            raise ValueError("{} is beyond the {} mazes asked for, so it is left over from a larger "
+                             "run".format(os.path.join(directory, name), count))
+    tasks = []
+    done = 0
+    for shard, first in enumerate(range(0, count, shard_size)):
+        path = os.path.join(directory, SHARD_NAME.format(shard))
+        shard_count = min(shard_size, count - first)
+        if os.path.exists(path) and shard_complete(path, shard_count, method, dimensions,
+                                                   shard_seed(seed, shard)):
+            done += shard_count
+        else:
+            tasks.append((path, shard_count, method, dimensions, shard_seed(seed, shard)))
+    return tasks, done
+
+
+def at_least(minimum):
+    """
+    Returns an argparse type for integers no less than minimum
+    """
+    def parse(text):
+        value = int(text)
+        if value < minimum:
+            raise argparse.ArgumentTypeError("must be at least {}".format(minimum))
+        return value
+    return parse
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generates many mazes in parallel, writing them in shards "
+                                                 "of maze files. Run it again with the same arguments to "
+                                                 "finish an interrupted run.")
+    parser.add_argument("directory", help="directory to write the shards to")
+    parser.add_argument("count", type=at_least(0), help="number of mazes to generate")
+    parser.add_argument("--method", choices=METHODS, default="percolate",
+                        help="2D generator to use, or 3d for 3D mazes")
+    parser.add_argument("--size", type=at_least(1), nargs="+", default=[20, 20],
+                        help="width and height of the mazes, and the depth of 3D mazes")
+    parser.add_argument("--seed", type=at_least(0), default=0, help="seed of the run")
+    parser.add_argument("--shard-size", type=at_least(1), default=SHARD_SIZE,
+                        help="number of mazes in each shard")
+    parser.add_argument("--workers", type=at_least(1), default=os.cpu_count(),
+                        help="number of processes to use")
+    arguments = parser.parse_args()
+    dimensions = tuple(arguments.size)
+    if len(dimensions) != (3 if arguments.method == "3d" else 2):
+        parser.error("--size needs {} numbers for this method".format(3 if arguments.method == "3d" else 2))
+
+    os.makedirs(arguments.directory, exist_ok=True)
+    try:
+        tasks, done = shard_tasks(arguments.directory, arguments.count, arguments.method, dimensions,
+                                  arguments.seed, arguments.shard_size)
+    except ValueError as error:
+        parser.error(error)
+    if done:
+        print("{} mazes already generated".format(done))
+    start = perf_counter()
+    generated = 0
+    with Pool(arguments.workers) as pool:
+        # Shards are handed out one at a time as workers become free, since
+        # some mazes take longer than others
+        for path, count in pool.imap_unordered(generate_shard, tasks):
+            generated += count
+            print("{} ({}/{} mazes, {:.0f} mazes/s)".format(
+                path, done + generated, arguments.count, generated / (perf_counter() - start)))
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
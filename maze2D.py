@@ -1,276 +1,281 @@
+import base64
 import tkinter as tk
-from copy import deepcopy
-import random
 from tkinter import messagebox
+from maze2D_core import generate_maze, png_bytes, rasterise_maze, wall_runs
 
 WIDTH = 800
 HEIGHT = 600
-MAX_ROWS = 99
-MAX_COLUMNS = 133
-
-root = tk.Tk()
-entry_rows = tk.Entry(root)
-entry_columns = tk.Entry(root)
-entry_rows.insert(0, "20")
-entry_columns.insert(0, "20")
-label_rows = tk.Label(root, text="Number of rows:")
-label_columns = tk.Label(root, text="Number of columns:")
-label_rows.grid(row=0, column=0)
-entry_rows.grid(row=0, column=1)
-label_columns.grid(row=1, column=0)
-entry_columns.grid(row=1, column=1)
-
-
-def start_maze():
-    global width, height
-    ec = entry_columns.get()
-    er = entry_rows.get()
-    width = int(entry_columns.get()) if (ec.isnumeric and ec) else 20
-    height = int(entry_rows.get()) if (er.isnumeric and er) else 20
-    if width > MAX_COLUMNS:
-        width = MAX_COLUMNS
-    if height > MAX_ROWS:
-        height = MAX_ROWS
-    root.destroy()
-
-
-button = tk.Button(root, text="Start maze", command=start_maze)
-button.grid(row=2, column=0, columnspan=2)
-
-root.mainloop()
+MAX_ROWS = 10000
+MAX_COLUMNS = 10000
+# Mazes are never drawn with cells smaller than this, scrolling instead
+MIN_CELL_SIZE = 10
+# Walls are added to and removed from the canvas in chunks of this many
+# cells square
+CHUNK_SIZE = 16
+# and RasterMaze draws chunks of this many cells square as single images
+RASTER_CHUNK_SIZE = 64
+# Bigger mazes are generated with Eller's algorithm, which needs far less
+# memory than percolate
+LARGE_MAZE_CELLS = 1000000
 
-root = tk.Tk()
-canvas = tk.Canvas(root, width=WIDTH, height=HEIGHT)
-canvas.pack()
 
-
-def congratulations():
+def congratulations(root):
     messagebox.showinfo("Congratulations!", "You solved the maze, well done!")
     root.destroy()
 
 
 class Maze(object):
-    def __init__(self, width, height, wall, goal_position, player_position=(0, 0)):
+    """
+    wall is a (height, width, 2) array of uint8, where wall[row, column, 0]
+    is 1 if there is a wall below the cell and wall[row, column, 1] is 1 if
+    there is a wall to the right of it.
+    Mazes too big to fit in the window at MIN_CELL_SIZE are drawn at that
+    size instead, and the view scrolls to follow the player. The walls are
+    drawn in square chunks of cells, and only the chunks in view are kept
+    on the canvas, so the drawing cost depends on the window size rather
+    than the maze size.
+    """
+    def __init__(self, canvas, width, height, wall, goal_position, player_position=(0, 0)):
+        self.canvas = canvas
         self.width = width
         self.height = height
         self.wall = wall
         self.goal = list(goal_position)
         self.player = list(player_position)
-        self.cell_size = int(min((WIDTH - 2)/self.width, (HEIGHT - 2)/self.height))
-        self.start_x = int((WIDTH - self.cell_size * self.width) / 2)
-        self.start_y = int((HEIGHT - self.cell_size * self.height) / 2)
+        fitting_cell_size = int(min((WIDTH - 2)/self.width, (HEIGHT - 2)/self.height))
+        self.scrolling = fitting_cell_size < MIN_CELL_SIZE
+        if self.scrolling:
+            self.cell_size = MIN_CELL_SIZE
+            self.start_x = 1
+            self.start_y = 1
+        else:
+            self.cell_size = fitting_cell_size
+            self.start_x = int((WIDTH - self.cell_size * self.width) / 2)
+            self.start_y = int((HEIGHT - self.cell_size * self.height) / 2)
+        self.chunk_size = CHUNK_SIZE
+        # The (chunk row, chunk column) of the chunks on the canvas
+        self.drawn_chunks = set()
 
     def draw(self):
-        canvas.create_line(self.start_x, self.start_y,
-                           self.start_x + self.width * self.cell_size, self.start_y)
-        canvas.create_line(self.start_x, self.start_y, self.start_x,
-                           self.start_y + self.height * self.cell_size)
-        for column in range(self.width):
-            for row in range(self.height):
-                if self.wall[row][column][0]:
-                    canvas.create_line(self.start_x + column * self.cell_size,
-                                       self.start_y + (row + 1) * self.cell_size,
-                                       self.start_x + (column + 1) * self.cell_size,
-                                       self.start_y + (row + 1) * self.cell_size)
-                if self.wall[row][column][1]:
-                    canvas.create_line(self.start_x + (column + 1) * self.cell_size,
-                                       self.start_y + row * self.cell_size,
-                                       self.start_x + (column + 1) * self.cell_size,
-                                       self.start_y + (row + 1) * self.cell_size)
-
-        canvas.create_oval(self.start_x + self.goal[0] * self.cell_size,
-                           self.start_y + self.goal[1] * self.cell_size,
-                           self.start_x + (self.goal[0] + 1) * self.cell_size,
-                           self.start_y + (self.goal[1] + 1) * self.cell_size,
-                           fill="blue", width=0)
+        if self.scrolling:
+            self.canvas.configure(scrollregion=(0, 0, self.width * self.cell_size + 2,
+                                                self.height * self.cell_size + 2))
+        self.draw_goal()
         self.draw_player()
+        self.update_view()
+
+    def draw_goal(self):
+        self.canvas.create_oval(self.start_x + self.goal[0] * self.cell_size,
+                                self.start_y + self.goal[1] * self.cell_size,
+                                self.start_x + (self.goal[0] + 1) * self.cell_size,
+                                self.start_y + (self.goal[1] + 1) * self.cell_size,
+                                fill="blue", width=0)
+
+    def draw_chunk(self, chunk_row, chunk_column):
+        tags = ("wall", "chunk{}_{}".format(chunk_row, chunk_column))
+        first_row = chunk_row * self.chunk_size
+        first_column = chunk_column * self.chunk_size
+        last_row = min(first_row + self.chunk_size, self.height)
+        last_column = min(first_column + self.chunk_size, self.width)
+        x = self.start_x + first_column * self.cell_size
+        y = self.start_y + first_row * self.cell_size
+        # The top and left edges of the maze belong to the chunks along them
+        if first_row == 0:
+            self.canvas.create_line(x, y, self.start_x + last_column * self.cell_size, y, tags=tags)
+        if first_column == 0:
+            self.canvas.create_line(x, y, x, self.start_y + last_row * self.cell_size, tags=tags)
+        # Draw each straight run of panels as a single line
+        horizontal_runs, vertical_runs = wall_runs(self.wall[first_row:last_row, first_column:last_column])
+        for row, start, stop in horizontal_runs.tolist():
+            self.canvas.create_line(x + start * self.cell_size,
+                                    y + (row + 1) * self.cell_size,
+                                    x + stop * self.cell_size,
+                                    y + (row + 1) * self.cell_size, tags=tags)
+        for column, start, stop in vertical_runs.tolist():
+            self.canvas.create_line(x + (column + 1) * self.cell_size,
+                                    y + start * self.cell_size,
+                                    x + (column + 1) * self.cell_size,
+                                    y + stop * self.cell_size, tags=tags)
+
+    def delete_chunk(self, chunk_row, chunk_column):
+        self.canvas.delete("chunk{}_{}".format(chunk_row, chunk_column))
+
+    def visible_chunks(self):
+        """
+        :return: a tuple of the ranges of chunk rows and chunk columns in view
+        """
+        if not self.scrolling:
+            return (range((self.height - 1) // self.chunk_size + 1),
+                    range((self.width - 1) // self.chunk_size + 1))
+        chunk_pixels = self.chunk_size * self.cell_size
+        return (range(self.view_y // chunk_pixels, (self.view_y + HEIGHT) // chunk_pixels + 1),
+                range(self.view_x // chunk_pixels, (self.view_x + WIDTH) // chunk_pixels + 1))
+
+    def update_view(self):
+        if self.scrolling:
+            # Centre the view on the player, without going past the edges
+            # of the maze
+            total_width = self.width * self.cell_size + 2
+            total_height = self.height * self.cell_size + 2
+            player_x = self.start_x + int((self.player[0] + 0.5) * self.cell_size)
+            player_y = self.start_y + int((self.player[1] + 0.5) * self.cell_size)
+            self.view_x = max(0, min(player_x - WIDTH // 2, total_width - WIDTH))
+            self.view_y = max(0, min(player_y - HEIGHT // 2, total_height - HEIGHT))
+            self.canvas.xview_moveto(self.view_x / total_width)
+            self.canvas.yview_moveto(self.view_y / total_height)
+        chunk_rows, chunk_columns = self.visible_chunks()
+        needed = {(chunk_row, chunk_column) for chunk_row in chunk_rows for chunk_column in chunk_columns
+                  if chunk_row * self.chunk_size < self.height and chunk_column * self.chunk_size < self.width}
+        for chunk in self.drawn_chunks - needed:
+            self.delete_chunk(*chunk)
+        added = needed - self.drawn_chunks
+        for chunk in added:
+            self.draw_chunk(*chunk)
+        if added:
+            # Keep the walls underneath the goal and the player
+            self.canvas.tag_lower("wall")
+        self.drawn_chunks = needed
 
     def draw_player(self):
         colour = "green" if self.player == self.goal else "red"
-        canvas.create_oval(self.start_x + self.player[0] * self.cell_size,
-                           self.start_y + self.player[1] * self.cell_size,
-                           self.start_x + (self.player[0] + 1) * self.cell_size,
-                           self.start_y + (self.player[1] + 1) * self.cell_size,
-                           fill=colour, width=0, tags="player")
+        self.canvas.create_oval(self.start_x + self.player[0] * self.cell_size,
+                                self.start_y + self.player[1] * self.cell_size,
+                                self.start_x + (self.player[0] + 1) * self.cell_size,
+                                self.start_y + (self.player[1] + 1) * self.cell_size,
+                                fill=colour, width=0, tags="player")
+
+    def moved(self):
+        self.canvas.delete("player")
+        self.draw_player()
+        self.update_view()
+        if self.player == self.goal:
+            congratulations(self.canvas.winfo_toplevel())
 
     def down(self):
-        if not self.wall[self.player[1]][self.player[0]][0]:
+        if not self.wall[self.player[1], self.player[0], 0]:
             self.player[1] += 1
-            canvas.delete("player")
-            self.draw_player()
-            if self.player == self.goal:
-                congratulations()
+            self.moved()
 
     def up(self):
         if self.player[1] >= 1:
-            if not self.wall[self.player[1] - 1][self.player[0]][0]:
+            if not self.wall[self.player[1] - 1, self.player[0], 0]:
                 self.player[1] -= 1
-                canvas.delete("player")
-                self.draw_player()
-                if self.player == self.goal:
-                    congratulations()
+                self.moved()
 
     def right(self):
-        if not self.wall[self.player[1]][self.player[0]][1]:
+        if not self.wall[self.player[1], self.player[0], 1]:
             self.player[0] += 1
-            canvas.delete("player")
-            self.draw_player()
-            if self.player == self.goal:
-                congratulations()
+            self.moved()
 
     def left(self):
         if self.player[0] >= 1:
-            if not self.wall[self.player[1]][self.player[0] - 1][1]:
+            if not self.wall[self.player[1], self.player[0] - 1, 1]:
                 self.player[0] -= 1
-                canvas.delete("player")
-                self.draw_player()
-                if self.player == self.goal:
-                    congratulations()
+                self.moved()
 
 
-def grow_maze(width, height):
+class RasterMaze(Maze):
     """
-    Grow a maze by iteratively removing one of the panels bordering the
-    player's connected region.
-    :param width: number of columns
-    :param height: number of rows
-    :return: a tuple containing the wall, the goal position and the player position
+    A Maze whose walls and goal are drawn into images rather than as canvas
+    items, which is much faster for big mazes. Only the player is a canvas
+    item. A maze which fits in the window is a single image, while a
+    scrolling maze is split into chunks of RASTER_CHUNK_SIZE cells square.
     """
-    # Initialise used array. This keeps track of which cells have been used
-    row = [0] * width
-    used = []
-    for i in range(height):
-        used.append(row.copy())
-    used[0][0] = 1
-    # Initialise array wall
-    cell = [1, 1]
-    row = []
-    for i in range(width):
-        row.append(cell.copy())
-    wall = []
-    for i in range(height):
-        wall.append(deepcopy(row))
-    # active walls will be the list of panels we're considering knocking down.
-    active_panels = [[0, 0, 0], [0, 0, 1]]
-    while active_panels:
-        # knock down a panel
-        knock_down = random.choice(active_panels)
-        wall[knock_down[0]][knock_down[1]][knock_down[2]] = 0
-        if used[knock_down[0]][knock_down[1]]:
-            if knock_down[2] == 0:
-                added_cell = [knock_down[0] + 1, knock_down[1]]
-            else:
-                assert knock_down[2] == 1
-                added_cell = [knock_down[0], knock_down[1] + 1]
-        else:
-            added_cell = [knock_down[0], knock_down[1]]
-        used[added_cell[0]][added_cell[1]] = 1
-
-        def toggle(panel):
-            if panel in active_panels:
-                index = active_panels.index(panel)
-                active_panels[index: index + 1] = []
-            else:
-                active_panels.append(panel)
-
-        if added_cell[0] > 0:
-            toggle([added_cell[0] - 1, added_cell[1], 0])
-        if added_cell[1] > 0:
-            toggle([added_cell[0], added_cell[1] - 1, 1])
-        if added_cell[0] < height - 1:
-            toggle([added_cell[0], added_cell[1], 0])
-        if added_cell[1] < width - 1:
-            toggle([added_cell[0], added_cell[1], 1])
-    return wall, (width-1, height-1), (0, 0)
-
-
-def percolate_maze(width, height):
-    """
-    Produce a maze by iteratively removing a panel at random if the removal
-    doesn't produce a loop.
-    :param width: number of columns
-    :param height: number of rows
-    :return: a tuple containing the wall, the goal position and the player position
-    """
-    # Initialise root function. This is a function with
-    # root_f[cell1] = root_f[cell2] iff cell1 and cell2
-    # are in the same connected component.
-    root_f = []
-    for i in range(height):
-        row = []
-        for j in range(width):
-            row.append((i, j))
-        root_f.append(row)
-    # Initialise list of panels
-    panel_list = []
-    for i in range(height):
-        for j in range(width):
-            if i < height - 1:
-                panel_list.append([i, j, 0])
-            if j < width - 1:
-                panel_list.append([i, j, 1])
-    # Randomise panel list
-    random.shuffle(panel_list)
-    # initialise wall
-    cell = [1, 1]
-    row = []
-    for i in range(width):
-        row.append(cell.copy())
-    wall = []
-    for i in range(height):
-        wall.append(deepcopy(row))
-    # initialise dict giving the panels with each given root
-    root_dict = {(i, j): [(i, j)] for i in range(height) for j in range(width)}
-    # now for the iterative loop
-    while panel_list:
-        panel = panel_list.pop()
-        if panel[2] == 0:
-            adjacent_cells = [panel[0:2], [panel[0] + 1, panel[1]]]
-        else:
-            assert panel[2] == 1
-            adjacent_cells = [panel[0:2], [panel[0], panel[1] + 1]]
-        root0 = root_f[adjacent_cells[0][0]][adjacent_cells[0][1]]
-        root1 = root_f[adjacent_cells[1][0]][adjacent_cells[1][1]]
-        if root0 != root1:
-            # knock down wall
-            wall[panel[0]][panel[1]][panel[2]] = 0
-            # transfer cells with one root to the other root, depending
-            # on which of them has fewer cells
-            if len(root_dict[root0]) > len(root_dict[root1]):
-                for (i, j) in root_dict[root1]:
-                    root_f[i][j] = root0
-                root_dict[root0].extend(root_dict[root1])
-                del root_dict[root1]
-            else:
-                for (i, j) in root_dict[root0]:
-                    root_f[i][j] = root1
-                root_dict[root1].extend(root_dict[root0])
-                del root_dict[root0]
-    return wall, (width-1, height-1), (0, 0)
-
-
-def generate_maze(width, height, method="percolate"):
+    def __init__(self, canvas, width, height, wall, goal_position, player_position=(0, 0)):
+        super().__init__(canvas, width, height, wall, goal_position, player_position)
+        self.chunk_size = RASTER_CHUNK_SIZE if self.scrolling else max(width, height)
+        # The images of the chunks on the canvas, which have to be kept
+        # alive while they are shown
+        self.images = {}
+
+    def draw_goal(self):
+        # The goal is drawn into the images of the chunks
+        pass
+
+    def draw_chunk(self, chunk_row, chunk_column):
+        first_row = chunk_row * self.chunk_size
+        first_column = chunk_column * self.chunk_size
+        last_row = min(first_row + self.chunk_size, self.height)
+        last_column = min(first_column + self.chunk_size, self.width)
+        goal_position = None
+        if first_column <= self.goal[0] < last_column and first_row <= self.goal[1] < last_row:
+            goal_position = (self.goal[0] - first_column, self.goal[1] - first_row)
+        pixels = rasterise_maze(self.wall[first_row:last_row, first_column:last_column], self.cell_size,
+                                goal_position, top_edge=first_row == 0, left_edge=first_column == 0)
+        # Tk reads PNG data encoded in base64. Compression is not worth
+        # the time here.
+        image = tk.PhotoImage(data=base64.b64encode(png_bytes(pixels, compression=0)))
+        self.images[chunk_row, chunk_column] = image
+        self.canvas.create_image(self.start_x + first_column * self.cell_size,
+                                 self.start_y + first_row * self.cell_size, image=image, anchor="nw",
+                                 tags=("wall", "chunk{}_{}".format(chunk_row, chunk_column)))
+
+    def delete_chunk(self, chunk_row, chunk_column):
+        super().delete_chunk(chunk_row, chunk_column)
+        del self.images[chunk_row, chunk_column]
+
+
+def choose_size():
     """
-    Generates a maze using the method given
-    :param width: number of columns
-    :param height: number of rows
-    :param method: The supported methods are
-    "grow" and "percolate". Percolate is used as default since it tends to produce
-    more interesting mazes.
-    :return: a tuple containing the wall, the goal position and the player position
+    Asks for the size of the maze, and whether to draw it as an image.
+    :return: a tuple containing the width, the height and whether to draw
+    the maze as an image, or None if the window was closed
     """
-    if method == "grow":
-        return grow_maze(width, height)
-    if method == "percolate":
-        return percolate_maze(width, height)
+    root = tk.Tk()
+    entry_rows = tk.Entry(root)
+    entry_columns = tk.Entry(root)
+    entry_rows.insert(0, "20")
+    entry_columns.insert(0, "20")
+    label_rows = tk.Label(root, text="Number of rows:")
+    label_columns = tk.Label(root, text="Number of columns:")
+    label_rows.grid(row=0, column=0)
+    entry_rows.grid(row=0, column=1)
+    label_columns.grid(row=1, column=0)
+    entry_columns.grid(row=1, column=1)
+    raster = tk.BooleanVar()
+    tk.Checkbutton(root, text="Draw as an image (faster for big mazes)",
+                   variable=raster).grid(row=2, column=0, columnspan=2)
+    size = []
+
+    def start_maze():
+        ec = entry_columns.get()
+        er = entry_rows.get()
+        width = int(ec) if (ec.isnumeric() and ec) else 20
+        height = int(er) if (er.isnumeric() and er) else 20
+        if width > MAX_COLUMNS:
+            width = MAX_COLUMNS
+        if height > MAX_ROWS:
+            height = MAX_ROWS
+        size.extend((width, height, raster.get()))
+        root.destroy()
+
+    button = tk.Button(root, text="Start maze", command=start_maze)
+    button.grid(row=3, column=0, columnspan=2)
+
+    root.mainloop()
+    return tuple(size) if size else None
+
+
+def main():
+    size = choose_size()
+    if size is None:
+        return
+    width, height, raster = size
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width=WIDTH, height=HEIGHT)
+    canvas.pack()
+    method = "eller" if width * height > LARGE_MAZE_CELLS else "percolate"
+    wall, goal_pos, player_pos = generate_maze(width, height, method)
+    maze_class = RasterMaze if raster else Maze
+    maze = maze_class(canvas, width, height, wall, goal_pos, player_pos)
+    maze.draw()
+    root.bind("<Down>", lambda z: maze.down())
+    root.bind("<Up>", lambda z: maze.up())
+    root.bind("<Right>", lambda z: maze.right())
+    root.bind("<Left>", lambda z: maze.left())
 
+    root.mainloop()
 
-wall, goal_pos, player_pos = generate_maze(width, height)
-maze = Maze(width, height, wall, goal_pos, player_pos)
-maze.draw()
-root.bind("<Down>", lambda z: maze.down())
-root.bind("<Up>", lambda z: maze.up())
-root.bind("<Right>", lambda z: maze.right())
-root.bind("<Left>", lambda z: maze.left())
 
-root.mainloop()
+if __name__ == "__main__":
+    main()
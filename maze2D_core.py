@@ -0,0 +1,489 @@
+import numpy as np
+import random
+import struct
+import zlib
+
+
+class RandomSet(object):
+    """
+    A set with constant time adding, removing and choosing of a random
+    element. The elements are kept in a list, and a dict gives the position
+    of each element in the list.
+    """
+    def __init__(self):
+        self.items = []
+        self.positions = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def __contains__(self, item):
+        return item in self.positions
+
+    def add(self, item):
+        self.positions[item] = len(self.items)
+        self.items.append(item)
+
+    def remove(self, item):
+        # Move the last element into the gap left by the removed element
+        position = self.positions.pop(item)
+        last = self.items.pop()
+        if position < len(self.items):
+            self.items[position] = last
+            self.positions[last] = position
+
+    def toggle(self, item):
+        if item in self:
+            self.remove(item)
+        else:
+            self.add(item)
+
+    def choice(self):
+        return random.choice(self.items)
+
+
+class DisjointSets(object):
+    """
+    Disjoint sets of the numbers from 0 to count - 1, which can be merged
+    (union-find). The numbers of each set form a tree in parent, whose root
+    labels the set, and size[root] is the number of numbers in the set.
+    """
+    def __init__(self, count):
+        self.parent = list(range(count))
+        self.size = [1] * count
+
+    def find(self, number):
+        """
+        Returns the root of the set containing number
+        """
+        parent = self.parent
+        # Walk up to the root, halving the path as we go
+        while parent[number] != number:
+            parent[number] = parent[parent[number]]
+            number = parent[number]
+        return number
+
+    def union(self, number0, number1):
+        """
+        Merges the sets containing number0 and number1.
+        :return: True if they were different sets, and False if they were
+        already the same set
+        """
+        root0 = self.find(number0)
+        root1 = self.find(number1)
+        if root0 == root1:
+            return False
+        # attach the root of the smaller set to the root of the larger one
+        if self.size[root0] < self.size[root1]:
+            root0, root1 = root1, root0
+        self.parent[root1] = root0
+        self.size[root0] += self.size[root1]
+        return True
+
+
+def grow_maze(width, height):
+    """
+    Grow a maze by iteratively removing one of the panels bordering the
+    player's connected region.
+    :param width: number of columns
+    :param height: number of rows
+    :return: a tuple containing the wall, the goal position and the player position
+    """
+    # Cells are numbered row * width + column, and the panel below cell n
+    # is numbered 2 * n, while the panel to the right of it is 2 * n + 1.
+    # Initialise used array. This keeps track of which cells have been used
+    used = [0] * (width * height)
+    used[0] = 1
+    # Initialise array wall. The panel numbered p is flat_wall[p].
+    wall = np.ones((height, width, 2), dtype=np.uint8)
+    flat_wall = wall.reshape(-1)
+    # active panels will be the set of panels we're considering knocking down.
+    active_panels = RandomSet()
+    if height > 1:
+        active_panels.add(0)
+    if width > 1:
+        active_panels.add(1)
+    while active_panels:
+        # knock down a panel
+        knock_down = active_panels.choice()
+        knock_down_cell, direction = divmod(knock_down, 2)
+        flat_wall[knock_down] = 0
+        if used[knock_down_cell]:
+            added_cell = knock_down_cell + (width if direction == 0 else 1)
+        else:
+            added_cell = knock_down_cell
+        used[added_cell] = 1
+        added_row, added_column = divmod(added_cell, width)
+        # Panels between the added cell and the rest of the region are no
+        # longer worth knocking down, while the others now border the region
+        if added_row > 0:
+            active_panels.toggle(2 * (added_cell - width))
+        if added_column > 0:
+            active_panels.toggle(2 * (added_cell - 1) + 1)
+        if added_row < height - 1:
+            active_panels.toggle(2 * added_cell)
+        if added_column < width - 1:
+            active_panels.toggle(2 * added_cell + 1)
+    return wall, (width-1, height-1), (0, 0)
+
+
+def percolate_maze(width, height):
+    """
+    Produce a maze by iteratively removing a panel at random if the removal
+    doesn't produce a loop.
+    :param width: number of columns
+    :param height: number of rows
+    :return: a tuple containing the wall, the goal position and the player position
+    """
+    # Cells are numbered row * width + column, and the connected components
+    # are kept as disjoint sets of cells
+    components = DisjointSets(width * height)
+    union = components.union
+    # initialise wall. The panel below cell n is numbered 2 * n, and the
+    # panel to the right of it is numbered 2 * n + 1, so the panel numbered
+    # p is flat_wall[p].
+    wall = np.ones((height, width, 2), dtype=np.uint8)
+    flat_wall = wall.reshape(-1)
+    # Initialise array of panels, leaving out those on the edge of the maze
+    knockable = np.ones((height, width, 2), dtype=bool)
+    knockable[height - 1, :, 0] = False
+    knockable[:, width - 1, 1] = False
+    panels = np.flatnonzero(knockable)
+    # Randomise panel order. The shuffle is seeded from random so that
+    # seeding random still determines the maze.
+    np.random.default_rng(random.getrandbits(64)).shuffle(panels)
+    # now for the iterative loop
+    for panel in panels.tolist():
+        cell_number, direction = divmod(panel, 2)
+        adjacent_cell_number = cell_number + (width if direction == 0 else 1)
+        # knock down the wall if it joins two components
+        if union(cell_number, adjacent_cell_number):
+            flat_wall[panel] = 0
+    return wall, (width-1, height-1), (0, 0)
+
+
+def eller_rows(width, height, seed=None):
+    """
+    Generates a maze one row at a time with Eller's algorithm, keeping only
+    the current row in memory, so that very tall mazes can be streamed.
+    :param width: number of columns
+    :param height: number of rows
+    :param seed: seed for the random number generator. If None, it is
+    seeded from random, so that seeding random still determines the maze.
+    :return: a generator of (wall_row, labels) tuples, from the top row
+    down. wall_row is a (width, 2) array of uint8 holding the walls of the
+    row as in percolate_maze, and labels gives each cell of the row the
+    number of its connected component in the rows generated so far, with
+    the components numbered from 0 in order of first appearance.
+    """
+    rng = random.Random(random.getrandbits(64) if seed is None else seed)
+    # Every cell of the first row starts in its own component
+    labels = list(range(width))
+    for row in range(height):
+        # The components of the row are kept as disjoint sets of labels
+        components = DisjointSets(width)
+        find = components.find
+        wall_row = np.ones((width, 2), dtype=np.uint8)
+        last_row = row == height - 1
+        # Knock down panels to the right of cells at random, provided the
+        # cells either side are not already connected. In the last row
+        # every such panel is knocked down, to join up all the components.
+        for column in range(width - 1):
+            if (find(labels[column]) != find(labels[column + 1])
+                    and (last_row or rng.random() < 0.5)):
+                wall_row[column, 1] = 0
+                components.union(labels[column], labels[column + 1])
+        # Renumber the components in order of first appearance
+        numbers = {}
+        labels = [numbers.setdefault(find(label), len(numbers)) for label in labels]
+        if not last_row:
+            # Knock down panels below cells at random, but at least one for
+            # each component, so that no component is cut off
+            members = [[] for _ in numbers]
+            for column, label in enumerate(labels):
+                members[label].append(column)
+            for cells in members:
+                down = [column for column in cells if rng.random() < 0.5]
+                for column in down or [rng.choice(cells)]:
+                    wall_row[column, 0] = 0
+        yield wall_row, np.array(labels)
+        if not last_row:
+            # Cells below a knocked down panel stay in the component above,
+            # and the others start components of their own
+            next_label = len(numbers)
+            for column in range(width):
+                if wall_row[column, 0]:
+                    labels[column] = next_label
+                    next_label += 1
+
+
+def write_maze_rows(stream, width, height, seed=None):
+    """
+    Generates a maze with eller_rows and writes it to a binary stream, such
+    as a file or socket.makefile("wb"), one row at a time.
+    :param stream: the stream to write to
+    :param width: number of columns
+    :param height: number of rows
+    :param seed: as for eller_rows
+    """
+    for wall_row, labels in eller_rows(width, height, seed):
+        stream.write(wall_row.tobytes())
+
+
+def read_maze_rows(stream, width):
+    """
+    Reads back the rows written by write_maze_rows, one row at a time.
+    :param stream: the binary stream to read from
+    :param width: number of columns
+    :return: a generator of (width, 2) arrays of uint8 holding the walls of
+    each row
+    """
+    row_size = 2 * width
+    while True:
+        data = stream.read(row_size)
+        if len(data) < row_size:
+            return
+        yield np.frombuffer(data, dtype=np.uint8).reshape(width, 2)
+
+
+def generate_maze(width, height, method="percolate"):
+    """
+    Generates a maze using the method given
+    :param width: number of columns
+    :param height: number of rows
+    :param method: The supported methods are
+    "grow", "percolate" and "eller". Percolate is used as default since it tends to produce
+    more interesting mazes.
+    :return: a tuple containing the wall, the goal position and the player position
+    """
+    if method == "grow":
+        return grow_maze(width, height)
+    if method == "percolate":
+        return percolate_maze(width, height)
+    if method == "eller":
+        wall = np.array([wall_row for wall_row, labels in eller_rows(width, height)])
+        return wall, (width-1, height-1), (0, 0)
+
+
+def runs(bits):
+    """
+    Finds the runs of consecutive 1s along each row of a 2D array.
+    :return: an (N, 3) array whose rows are (row, start, stop), where the
+    run covers bits[row, start:stop]
+    """
+    # Pad each row with 0s at both ends, so that every run starts at a step
+    # up and stops at a step down
+    padded = np.zeros((bits.shape[0], bits.shape[1] + 2), dtype=np.int8)
+    padded[:, 1:-1] = bits
+    steps = np.diff(padded, axis=1)
+    rows, starts = np.nonzero(steps == 1)
+    stops = np.nonzero(steps == -1)[1]
+    return np.stack((rows, starts, stops), axis=1)
+
+
+def wall_runs(wall):
+    """
+    Merges the panels of a wall into maximal straight runs, so that a wall
+    can be drawn with one line per run.
+    :param wall: (height, width, 2) array holding the walls
+    :return: a tuple of two (N, 3) arrays. The rows (row, start, stop) of
+    the first are horizontal runs below the given row, from column start to
+    column stop. The rows (column, start, stop) of the second are vertical
+    runs to the right of the given column, from row start to row stop.
+    """
+    return runs(wall[:, :, 0]), runs(wall[:, :, 1].T)
+
+
+# Colours of the pixels of a rasterised maze, indexed by the values
+# BACKGROUND, WALL, GOAL and PLAYER
+BACKGROUND = 0
+WALL = 1
+GOAL = 2
+PLAYER = 3
+PALETTE = np.array([(255, 255, 255), (0, 0, 0), (0, 0, 255), (255, 0, 0)], dtype=np.uint8)
+
+
+def disk(cell_size):
+    """
+    :return: a (cell_size, cell_size) boolean array which is True on the
+    disk filling a cell
+    """
+    centres = np.arange(cell_size) + 0.5 - cell_size / 2
+    return centres[:, np.newaxis] ** 2 + centres ** 2 <= (cell_size / 2) ** 2
+
+
+def rasterise_maze(wall, cell_size, goal_position=None, player_position=None,
+                   top_edge=True, left_edge=True):
+    """
+    Draws a maze into an array of pixels, with array operations.
+    :param wall: (height, width, 2) array holding the walls
+    :param cell_size: size of the cells in pixels
+    :param goal_position: (column, row) of the goal, or None to leave it out
+    :param player_position: (column, row) of the player, or None to leave
+    it out
+    :param top_edge: whether to draw the top edge of the maze
+    :param left_edge: whether to draw the left edge of the maze
+    :return: a (height * cell_size + 1, width * cell_size + 1) array of
+    uint8, holding BACKGROUND, WALL, GOAL or PLAYER for each pixel. Its
+    colours are given by PALETTE[pixels].
+    """
+    height, width = wall.shape[:2]
+    pixels = np.zeros((height * cell_size + 1, width * cell_size + 1), dtype=np.uint8)
+    # The walls below the cells of row r are drawn on pixel row
+    # (r + 1) * cell_size, from the left corner of each panel up to and
+    # including its right corner
+    lines = np.zeros((height, width * cell_size + 1), dtype=bool)
+    lines[:, :-1] = np.repeat(wall[:, :, 0].astype(bool), cell_size, axis=1)
+    lines[:, 1:] |= lines[:, :-1].copy()
+    pixels[cell_size::cell_size][lines] = WALL
+    # and likewise the walls to the right of the cells, column by column
+    lines = np.zeros((width, height * cell_size + 1), dtype=bool)
+    lines[:, :-1] = np.repeat(wall[:, :, 1].T.astype(bool), cell_size, axis=1)
+    lines[:, 1:] |= lines[:, :-1].copy()
+    pixels.T[cell_size::cell_size][lines] = WALL
+    if top_edge:
+        pixels[0] = WALL
+    if left_edge:
+        pixels[:, 0] = WALL
+    for position, value in ((goal_position, GOAL), (player_position, PLAYER)):
+        if position is not None:
+            cell = pixels[position[1] * cell_size + 1:(position[1] + 1) * cell_size,
+                          position[0] * cell_size + 1:(position[0] + 1) * cell_size]
+            cell[disk(cell_size - 1)] = value
+    return pixels
+
+
+def png_bytes(pixels, palette=PALETTE, compression=6):
+    """
+    Encodes an array of palette indices as a PNG image.
+    :param pixels: 2D array of uint8 indexing palette
+    :param palette: (N, 3) array of uint8 RGB colours, with N at most 256
+    :param compression: zlib compression level
+    :return: the bytes of the PNG file
+    """
+    height, width = pixels.shape
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # Each row of the image data starts with a 0 byte, meaning it is not
+    # filtered
+    rows = np.zeros((height, width + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0))
+            + chunk(b"PLTE", np.asarray(palette, dtype=np.uint8).tobytes())
+            + chunk(b"IDAT", zlib.compress(rows.tobytes(), compression))
+            + chunk(b"IEND", b""))
+
+
+def save_maze_png(path, wall, goal_position, player_position=None, cell_size=10):
+    """
+    Saves a picture of a maze as a PNG file, for instance for printing.
+    :param path: the file to write
+    :param wall: (height, width, 2) array holding the walls
+    :param goal_position: (column, row) of the goal
+    :param player_position: (column, row) of the player, or None to leave
+    it out
+    :param cell_size: size of the cells in pixels
+    """
+    with open(path, "wb") as file:
+        file.write(png_bytes(rasterise_maze(wall, cell_size, goal_position, player_position)))
+
+
+# batch_percolate_mazes works on at most BATCH_SIZE mazes, and at most
+# BATCH_CELLS cells, at a time, which keeps its working arrays small enough
+# to stay in the processor's cache
+BATCH_SIZE = 2048
+BATCH_CELLS = 1 << 16
+
+
+def batch_percolate_mazes(count, width, height, seed=None):
+    """
+    Produces count mazes at once with the percolate method. The mazes are
+    built together with array operations, in a number of steps that grows
+    with the logarithm of the number of cells rather than with the number
+    of panels.
+    :param count: number of mazes
+    :param width: number of columns
+    :param height: number of rows
+    :param seed: seed for the random number generator, so that the same
+    seed always gives the same mazes
+    :return: an array of shape (count, height, width, 2) stacking the walls
+    of the mazes. The goal and player positions are as for percolate_maze.
+    """
+    rng = np.random.default_rng(seed)
+    walls = np.empty((count, height, width, 2), dtype=np.uint8)
+    chunk = max(1, min(BATCH_SIZE, BATCH_CELLS // (width * height)))
+    for start in range(0, count, chunk):
+        walls[start:start + chunk] = _percolate_batch(rng, min(chunk, count - start), width, height)
+    return walls
+
+
+def _percolate_batch(rng, count, width, height):
+    cell_count = width * height
+    # Panels are numbered as in percolate_maze. Knocking them down in a
+    # random order, skipping those that would make a loop, gives the
+    # minimum spanning tree of the maze's grid when each panel is weighted
+    # by its place in the order. Boruvka's algorithm finds the same tree in
+    # a few rounds, each of which works on every panel of every maze at
+    # once, instead of one step per panel.
+    knockable = np.ones((height, width, 2), dtype=bool)
+    knockable[height - 1, :, 0] = False
+    knockable[:, width - 1, 1] = False
+    panels = np.flatnonzero(knockable).astype(np.int32)
+    # The cells of all the mazes are numbered together, with those of maze m
+    # numbered from m * cell_count, and likewise their panels. Each panel
+    # joins the components ends0 and ends1 either side of it, which start
+    # as the cells themselves, and ranks gives its place in the order of
+    # its maze, so ranks are distinct within each component.
+    offsets = np.arange(count, dtype=np.int32)[:, np.newaxis] * cell_count
+    ends0 = (offsets + panels // 2).reshape(-1)
+    ends1 = ends0 + np.tile(np.where(panels % 2, 1, width).astype(np.int32), count)
+    positions = (2 * offsets + panels).reshape(-1)
+    ranks = rng.permuted(np.tile(np.arange(len(panels), dtype=np.int32), (count, 1)), axis=1).reshape(-1)
+    walls = np.ones(count * cell_count * 2, dtype=np.uint8)
+    component_count = count * cell_count
+    no_panel = np.iinfo(np.int32).max
+    while len(ends0):
+        # Each component takes the cheapest panel out of it, and the panel
+        # is knocked down
+        cheapest = np.full(component_count, no_panel, dtype=np.int32)
+        np.minimum.at(cheapest, ends0, ranks)
+        np.minimum.at(cheapest, ends1, ranks)
+        chosen0 = cheapest[ends0] == ranks
+        chosen1 = cheapest[ends1] == ranks
+        walls[positions[chosen0 | chosen1]] = 0
+        # Hook each component onto the one across its cheapest panel
+        hook = np.arange(component_count, dtype=np.int32)
+        hook[ends0[chosen0]] = ends1[chosen0]
+        hook[ends1[chosen1]] = ends0[chosen1]
+        labels, component_count = _merge_components(hook)
+        ends0, ends1 = labels[ends0], labels[ends1]
+        # Panels inside a component never join anything again
+        between = ends0 != ends1
+        ends0, ends1, ranks, positions = ends0[between], ends1[between], ranks[between], positions[between]
+    return walls.reshape(count, height, width, 2)
+
+
+def _merge_components(hook):
+    """
+    Merges components for _percolate_batch, given the component hook[n]
+    that each component n has chosen to join, or n itself.
+    :return: an array giving each component the number of the merged
+    component it is part of, with the merged components numbered from 0,
+    and the number of merged components
+    """
+    labels = np.arange(len(hook), dtype=np.int32)
+    # Two components may choose the same panel, hooking onto each other, in
+    # which case the one with the smaller number stays a root
+    mutual = (hook[hook] == labels) & (labels < hook)
+    hook[mutual] = labels[mutual]
+    # Follow the hooks to the roots by pointer jumping
+    while True:
+        jumped = hook[hook]
+        if np.array_equal(jumped, hook):
+            break
+        hook = jumped
+    roots = hook == labels
+    return (np.cumsum(roots, dtype=np.int32) - 1)[hook], int(np.count_nonzero(roots))
@@ -0,0 +1,1032 @@
+from math import cos, sin
+from collections import deque
+import copy
+from time import perf_counter
+import csv
+import numpy as np
+import random
+import itertools
+from maze2D_core import DisjointSets
+
+
+SCREEN_WIDTH = 800
+SCREEN_HEIGHT = 600
+UNIT_SIZE = 300
+# Panels are clipped to the part with z >= NEAR_PLANE before projecting
+NEAR_PLANE = 1e-6
+TRANSLATION_STEP = 0.03
+ROTATIONS_PER_ORTHONORMALISATION = 100
+
+
+def rotation_matrix(axis, angle):
+    if axis == "x":
+        return np.array([[1, 0, 0], [0, cos(angle), -sin(angle)], [0, sin(angle), cos(angle)]])
+    if axis == "y":
+        return np.array([[cos(angle), 0, -sin(angle)], [0, 1, 0], [sin(angle), 0, cos(angle)]])
+    if axis == "z":
+        return np.array([[cos(angle), -sin(angle), 0], [sin(angle), cos(angle), 0], [0, 0, 1]])
+
+
+def screen_position(spatial_position):
+    """
+    Draw as an observer sitting at the origin projecting things onto
+    the z = 1 plane. Returns canvas coordinates ready for drawing.
+    """
+    x, y, z = tuple(spatial_position)
+    projected_x = x/z
+    projected_y = y/z
+    canvas_x = SCREEN_WIDTH/2 + UNIT_SIZE*projected_x
+    canvas_y = SCREEN_HEIGHT/2 - UNIT_SIZE*projected_y
+    return canvas_x, canvas_y
+
+
+def screen_positions(spatial_positions):
+    """
+    Vectorised version of screen_position, acting on the last axis of an
+    array of spatial positions.
+    """
+    projected = spatial_positions[..., 0:2] / spatial_positions[..., 2:3]
+    return np.array((SCREEN_WIDTH/2, SCREEN_HEIGHT/2)) + UNIT_SIZE*projected*np.array((1, -1))
+
+
+def in_view(spatial_position):
+    return spatial_position[2] > 0
+
+
+# The planes bounding the view frustum, as (normal, offset) pairs. A point p
+# is on the visible side of a plane when dot(normal, p) >= offset.
+_HALF_WIDTH = SCREEN_WIDTH / (2 * UNIT_SIZE)
+_HALF_HEIGHT = SCREEN_HEIGHT / (2 * UNIT_SIZE)
+FRUSTUM_PLANES = [
+    (np.array((0, 0, 1)), NEAR_PLANE),
+    (np.array((1, 0, _HALF_WIDTH)), 0),
+    (np.array((-1, 0, _HALF_WIDTH)), 0),
+    (np.array((0, 1, _HALF_HEIGHT)), 0),
+    (np.array((0, -1, _HALF_HEIGHT)), 0),
+]
+
+
+def cull(vertices):
+    """
+    Takes an (N, 4, 3) array of panel vertices in view coordinates and
+    returns a boolean array which is False for panels that are certainly
+    out of view, because all their vertices are on the invisible side of
+    one of the frustum planes.
+    """
+    visible = np.ones(len(vertices), dtype=bool)
+    for normal, offset in FRUSTUM_PLANES:
+        visible &= np.any(np.matmul(vertices, normal) >= offset, axis=1)
+    return visible
+
+
+def clip_polygons(polygons, counts, normal, offset):
+    """
+    Clips a batch of convex polygons against the plane given by normal and
+    offset (see FRUSTUM_PLANES), with the Sutherland-Hodgman algorithm.
+    polygons is an (N, K, 3) array where polygon i has its counts[i]
+    vertices first. Returns the clipped polygons in the same form.
+    """
+    n, k, _ = polygons.shape
+    slots = np.arange(k)
+    valid = slots < counts[:, np.newaxis]
+    # The vertex following each vertex, wrapping round at the last valid one
+    following = np.where(slots + 1 < counts[:, np.newaxis], slots + 1, 0)
+    next_polygons = np.take_along_axis(polygons, following[:, :, np.newaxis], axis=1)
+    distances = np.matmul(polygons, normal) - offset
+    next_distances = np.take_along_axis(distances, following, axis=1)
+    inside = valid & (distances >= 0)
+    crossing = valid & ((distances >= 0) != (next_distances >= 0))
+    fractions = distances / np.where(crossing, distances - next_distances, 1)
+    intersections = polygons + fractions[:, :, np.newaxis] * (next_polygons - polygons)
+    # Each edge contributes its first vertex if that is inside, followed by
+    # the point where it crosses the plane if it does.
+    candidates = np.stack((polygons, intersections), axis=2).reshape(n, 2 * k, 3)
+    keep = np.stack((inside, crossing), axis=2).reshape(n, 2 * k)
+    # Move the kept vertices to the front, preserving their order
+    arrangement = np.argsort(~keep, axis=1, kind="stable")
+    new_counts = np.count_nonzero(keep, axis=1)
+    width = new_counts.max(initial=0)
+    clipped = np.take_along_axis(candidates, arrangement[:, :width, np.newaxis], axis=1)
+    return clipped, new_counts
+
+
+def clip_to_view(vertices):
+    """
+    Clips an (N, 4, 3) array of panel vertices in view coordinates to the
+    view frustum. Returns an array of polygons and an array of vertex
+    counts, as for clip_polygons.
+    """
+    polygons = vertices
+    counts = np.full(len(vertices), 4)
+    for normal, offset in FRUSTUM_PLANES:
+        polygons, counts = clip_polygons(polygons, counts, normal, offset)
+    return polygons, counts
+
+
+def screen_rectangles(vertices):
+    """
+    Takes an (N, 4, 3) array of panel vertices in view coordinates and
+    returns an (N, 4) array giving the bounding rectangle
+    (left, top, right, bottom) on screen of the visible part of each panel.
+    Panels with no visible part get rectangles with left > right.
+    """
+    polygons, counts = clip_to_view(vertices)
+    points = screen_positions(polygons)
+    valid = (np.arange(polygons.shape[1]) < counts[:, np.newaxis])[:, :, np.newaxis]
+    lowest = np.where(valid, points, np.inf).min(axis=1, initial=np.inf)
+    highest = np.where(valid, points, -np.inf).max(axis=1, initial=-np.inf)
+    rectangles = np.concatenate((lowest, highest), axis=1)
+    rectangles[counts < 3] = (1, 1, 0, 0)
+    return rectangles
+
+
+# The stages of a frame timed by FrameProfiler, in the order they happen,
+# and the numbers of panels it counts
+PROFILE_STAGES = ["rotate", "collision", "translate", "visibility", "sort", "transform",
+                  "clip", "project", "draw", "display"]
+PROFILE_COUNTS = ["panels", "culled", "drawn"]
+# FrameProfiler keeps the records of this many frames, the most recent
+PROFILE_FRAMES = 36000
+
+
+class _StageTimer(object):
+    def __init__(self, frame, name):
+        self.frame = frame
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.frame[self.name] += perf_counter() - self.start
+
+
+class _NoTimer(object):
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+class FrameProfiler(object):
+    """
+    Records the time spent in each of the PROFILE_STAGES of every frame,
+    and the numbers of panels considered for drawing, culled and drawn.
+    Timing and counting do nothing outside start_frame and end_frame.
+    """
+    def __init__(self):
+        self.frames = deque(maxlen=PROFILE_FRAMES)
+        self.frame = None
+
+    def start_frame(self):
+        self.frame = dict.fromkeys(PROFILE_STAGES + PROFILE_COUNTS, 0)
+        self.frame_start = perf_counter()
+
+    def end_frame(self):
+        self.frame["total"] = perf_counter() - self.frame_start
+        self.frames.append(self.frame)
+        self.frame = None
+
+    def stage(self, name):
+        """
+        Returns a context manager which adds the time spent in it to the
+        stage called name.
+        """
+        if self.frame is None:
+            return _NoTimer()
+        return _StageTimer(self.frame, name)
+
+    def count(self, name, number):
+        if self.frame is not None:
+            self.frame[name] += number
+
+    def averages(self, frame_count=30):
+        """
+        Returns a dict of the averages of the stage times, total time and
+        counts over the last frame_count frames, or None if there are none.
+        """
+        frames = list(self.frames)[-frame_count:]
+        if not frames:
+            return None
+        return {key: sum(frame[key] for frame in frames) / len(frames) for key in frames[0]}
+
+    def write_csv(self, path):
+        """
+        Writes one row per recorded frame to a CSV file, with times in seconds
+        """
+        # Copy the frames first, since another thread may be recording more
+        # of them, and list() copies a deque without letting other threads in
+        frames = list(self.frames)
+        with open(path, "w", newline="") as file:
+            writer = csv.DictWriter(file, ["total"] + PROFILE_STAGES + PROFILE_COUNTS)
+            writer.writeheader()
+            writer.writerows(frames)
+
+
+# Used when rendering without a profiler, so that timing does nothing
+_NO_PROFILER = FrameProfiler()
+
+
+def render_panels(vertices, colours, draw_polygon, profiler=_NO_PROFILER):
+    """
+    Renders the panels given by an (N, 4, 3) array of vertices in view
+    coordinates, in order, by calling draw_polygon(colour, points) with
+    screen coordinates. Panels out of view are culled, and the rest are
+    clipped to the view frustum, before anything is projected.
+    """
+    with profiler.stage("clip"):
+        visible = cull(vertices)
+        polygons, counts = clip_to_view(vertices[visible])
+    with profiler.stage("project"):
+        point_lists = screen_positions(polygons)
+    drawn = 0
+    with profiler.stage("draw"):
+        for colour, point_list, count in zip(colours[visible], point_lists, counts):
+            # Clipping can leave nothing, or a degenerate sliver
+            if count >= 3:
+                draw_polygon(colour, point_list[:count])
+                drawn += 1
+    profiler.count("culled", len(vertices) - drawn)
+    profiler.count("drawn", drawn)
+
+
+def expand_ranges(starts, lengths):
+    """
+    Returns the index into starts of each element of the ranges
+    range(starts[i], starts[i] + lengths[i]) laid end to end, and the
+    elements themselves.
+    """
+    owners = np.repeat(np.arange(len(starts), dtype=np.int32), lengths)
+    shifts = (starts - np.cumsum(lengths) + lengths).astype(np.int32)
+    return owners, shifts[owners] + np.arange(len(owners), dtype=np.int32)
+
+
+def rasterise_panels(vertices, colours, goal_position=None, profiler=_NO_PROFILER):
+    """
+    Draws the panels given by an (N, 4, 3) array of vertices in view
+    coordinates into an image with a depth buffer, so that the panels can
+    be given in any order. Everything is done with array operations.
+    Returns a (SCREEN_HEIGHT, SCREEN_WIDTH, 3) array of uint8 colours,
+    including the goal if goal_position is given in view coordinates.
+    """
+    with profiler.stage("clip"):
+        visible = cull(vertices)
+        vertices = vertices[visible]
+        colours = colours[visible]
+        # Seen from the camera, the reciprocal of the depth of a panel is a
+        # linear function of screen position, found from its plane n . p = d
+        normals = np.cross(vertices[:, 1] - vertices[:, 0], vertices[:, 3] - vertices[:, 0])
+        offsets = np.einsum("ij,ij->i", normals, vertices[:, 0])
+        # Panels seen edge on cover nothing
+        facing = np.abs(offsets) > 1e-12
+        vertices, colours, normals, offsets = (vertices[facing], colours[facing],
+                                               normals[facing], offsets[facing])
+        polygons, counts = clip_to_view(vertices)
+    with profiler.stage("project"):
+        points = screen_positions(polygons)
+        # 1 / z = a * x + b * y + c at the screen position (x, y)
+        a = normals[:, 0] / (UNIT_SIZE * offsets)
+        b = -normals[:, 1] / (UNIT_SIZE * offsets)
+        c = (normals[:, 2] - SCREEN_WIDTH / 2 * normals[:, 0] / UNIT_SIZE
+             + SCREEN_HEIGHT / 2 * normals[:, 1] / UNIT_SIZE) / offsets
+        # Split each polygon into a fan of triangles
+        triangles = []
+        triangle_panels = []
+        for corner in range(1, polygons.shape[1] - 1):
+            fanned = np.flatnonzero(counts > corner + 1)
+            triangles.append(points[fanned][:, [0, corner, corner + 1]])
+            triangle_panels.append(fanned)
+        triangles = np.concatenate(triangles) if triangles else np.zeros((0, 3, 2))
+        triangle_panels = np.concatenate(triangle_panels) if triangle_panels else np.zeros(0, dtype=int)
+    with profiler.stage("draw"):
+        # A pixel is covered by a triangle if its centre is. Each triangle
+        # covers a span of pixels in each of the rows between its top and
+        # bottom.
+        first_rows = np.clip(np.ceil(triangles[:, :, 1].min(axis=1) - 0.5), 0, SCREEN_HEIGHT).astype(int)
+        end_rows = np.clip(np.ceil(triangles[:, :, 1].max(axis=1) - 0.5), 0, SCREEN_HEIGHT).astype(int)
+        span_triangles, span_rows = expand_ranges(first_rows, np.maximum(end_rows - first_rows, 0))
+        centre_y = span_rows + 0.5
+        left = np.full(len(span_rows), np.inf)
+        right = np.full(len(span_rows), -np.inf)
+        for edge in range(3):
+            start = triangles[span_triangles, edge]
+            end = triangles[span_triangles, (edge + 1) % 3]
+            crossing = (start[:, 1] <= centre_y) != (end[:, 1] <= centre_y)
+            run = np.where(crossing, end[:, 1] - start[:, 1], 1)
+            x = start[:, 0] + (centre_y - start[:, 1]) * (end[:, 0] - start[:, 0]) / run
+            left = np.where(crossing, np.minimum(left, x), left)
+            right = np.where(crossing, np.maximum(right, x), right)
+        first_columns = np.clip(np.ceil(left - 0.5), 0, SCREEN_WIDTH).astype(int)
+        end_columns = np.clip(np.ceil(right - 0.5), 0, SCREEN_WIDTH).astype(int)
+        pixel_spans, columns = expand_ranges(first_columns, np.maximum(end_columns - first_columns, 0))
+        # Work out what is the same along each span once per span
+        span_panels = triangle_panels[span_triangles]
+        span_depths = (a[span_panels] * 0.5 + b[span_panels] * centre_y + c[span_panels]).astype(np.float32)
+        pixel_panels = span_panels[pixel_spans]
+        inverse_depths = (span_depths[pixel_spans]
+                          + a[span_panels].astype(np.float32)[pixel_spans] * columns.astype(np.float32))
+        pixels = (span_rows * SCREEN_WIDTH).astype(np.int32)[pixel_spans] + columns
+        # The goal is a disc at the depth of its centre, coloured by the
+        # entry after the panels in the palette
+        goal_circle = None if goal_position is None else Goal(goal_position).screen_circle()
+        if goal_circle is not None:
+            (centre_x, centre_y), radius = goal_circle
+            disc_rows = np.arange(max(centre_y - radius, 0), min(centre_y + radius + 1, SCREEN_HEIGHT))
+            disc_columns = np.arange(max(centre_x - radius, 0), min(centre_x + radius + 1, SCREEN_WIDTH))
+            inside = (disc_rows[:, np.newaxis] - centre_y) ** 2 + (disc_columns - centre_x) ** 2 <= radius ** 2
+            disc_pixels = (disc_rows[:, np.newaxis] * SCREEN_WIDTH + disc_columns)[inside]
+            pixels = np.concatenate((pixels, disc_pixels))
+            pixel_panels = np.concatenate((pixel_panels, np.full(len(disc_pixels), len(colours))))
+            inverse_depths = np.concatenate((inverse_depths,
+                                             np.full(len(disc_pixels), 1 / goal_position[2], dtype=np.float32)))
+        # Keep the nearest, which has the greatest reciprocal depth, at
+        # each pixel. Pixels nothing covers get the last colour, black.
+        depth_buffer = np.zeros(SCREEN_WIDTH * SCREEN_HEIGHT, dtype=np.float32)
+        np.maximum.at(depth_buffer, pixels, inverse_depths)
+        nearest = inverse_depths == depth_buffer[pixels]
+        colour_buffer = np.full(SCREEN_WIDTH * SCREEN_HEIGHT, len(colours) + 1)
+        colour_buffer[pixels[nearest]] = pixel_panels[nearest]
+        palette = np.concatenate((colours, [(255, 255, 255), (0, 0, 0)])).astype(np.uint8)
+        image = palette[colour_buffer].reshape(SCREEN_HEIGHT, SCREEN_WIDTH, 3)
+    profiler.count("culled", len(visible) - len(counts))
+    profiler.count("drawn", len(counts))
+    return image
+
+
+# PANEL_CORNERS[index] gives the corners of the panel in front of the cell
+# at the origin, as approached from the direction given by index.
+PANEL_CORNERS = np.array([
+    [(-0.5, -0.5, -0.5), (-0.5, 0.5, -0.5), (-0.5, 0.5, 0.5), (-0.5, -0.5, 0.5)],
+    [(-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, -0.5, 0.5), (-0.5, -0.5, 0.5)],
+    [(-0.5, -0.5, -0.5), (0.5, -0.5, -0.5), (0.5, 0.5, -0.5), (-0.5, 0.5, -0.5)],
+])
+
+
+def ray_intersection_depths(vertices):
+    """
+    Takes an (N, 4, 3) array of panel vertices in view coordinates and
+    returns an array of length N giving the z coordinate at which the z axis
+    passes through each panel, or nan if it misses the panel.
+    """
+    # Writing a point of the panel's plane as v + c1 * w1 + c2 * w2, we solve
+    # the 2x2 system for the point with x = y = 0 by Cramer's rule.
+    v = vertices[:, 0]
+    w1 = vertices[:, 1] - v
+    w2 = vertices[:, 3] - v
+    determinant = w1[:, 0] * w2[:, 1] - w1[:, 1] * w2[:, 0]
+    # Panels seen edge on have no single intersection, and are masked out
+    solvable = determinant != 0
+    divisor = np.where(solvable, determinant, 1)
+    c1 = (v[:, 1] * w2[:, 0] - v[:, 0] * w2[:, 1]) / divisor
+    c2 = (v[:, 0] * w1[:, 1] - v[:, 1] * w1[:, 0]) / divisor
+    hit = solvable & (0 < c1) & (c1 < 1) & (0 < c2) & (c2 < 1)
+    return np.where(hit, c1 * w1[:, 2] + c2 * w2[:, 2] + v[:, 2], np.nan)
+
+
+class Camera(object):
+    """
+    The position and orientation of the observer in world coordinates.
+    A point with world coordinates w is seen at view coordinates
+    (w - position) @ orientation, so moving the observer never touches
+    the geometry of the world.
+    """
+    def __init__(self, position=(0, 0, 0), orientation=None):
+        self.position = np.array(position, dtype=float)
+        self.orientation = np.identity(3) if orientation is None else np.array(orientation, dtype=float)
+        self.rotations_since_orthonormalisation = 0
+        # version is increased whenever the view changes, so that anything
+        # computed from the view can be cached until the camera moves.
+        self.version = 0
+
+    def rotate(self, rot_matrix):
+        """
+        Rotates the view as if the world had been rotated by rot_matrix
+        about the observer.
+        """
+        self.orientation = np.matmul(self.orientation, rot_matrix)
+        self.rotations_since_orthonormalisation += 1
+        if self.rotations_since_orthonormalisation >= ROTATIONS_PER_ORTHONORMALISATION:
+            self.orthonormalise()
+        self.version += 1
+
+    def translate(self, translation_vector):
+        """
+        Moves the observer as if the world had been translated by
+        translation_vector in view coordinates.
+        """
+        self.position = self.position - np.matmul(self.orientation, translation_vector)
+        self.version += 1
+
+    def orthonormalise(self):
+        """
+        Replaces the orientation with the nearest rotation matrix, removing
+        the floating point error built up by repeated rotations.
+        """
+        u, _, vt = np.linalg.svd(self.orientation)
+        self.orientation = np.matmul(u, vt)
+        self.rotations_since_orthonormalisation = 0
+
+    def to_view(self, world_positions):
+        """
+        Transforms an array of world coordinates (last axis of length 3)
+        into view coordinates.
+        """
+        return np.matmul(world_positions - self.position, self.orientation)
+
+
+class Goal(object):
+    def __init__(self, position):
+        self.position = position
+
+    def __abs__(self):
+        """
+        Gives the distance to the centre of the goal
+        """
+        return np.linalg.norm(self.position)
+
+    def rotate(self, rot_matrix):
+        self.position = np.matmul(self.position, rot_matrix)
+
+    def translate(self, translation_vector):
+        self.position = self.position + translation_vector
+
+    def screen_circle(self):
+        """
+        Returns the centre and radius on screen of the goal, or None if it
+        is not in view.
+        """
+        if in_view(self.position):
+            return ((int(screen_position(self.position)[0]), int(screen_position(self.position)[1])),
+                    int(UNIT_SIZE*0.8/(2*abs(self))))
+        return None
+
+    def win(self):
+        """
+        The game is won if the goal is less than 0.4 away
+        """
+        return abs(self) < 0.4
+
+
+class Panel(object):
+    """
+    A panel object is a square, with vertices given as a (4, 3) numpy array.
+    A maze built from a list of panels copies their vertices into its own
+    shared vertex array.
+    """
+    def __init__(self, vertices, colour):
+        self.vertices = np.asarray(vertices, dtype=float)
+        self.colour = colour
+
+    def rotate(self, rot_matrix):
+        self.vertices = np.matmul(self.vertices, rot_matrix)
+
+    def __abs__(self):
+        """
+        Gives the distance to the centre of the panel
+        """
+        return np.linalg.norm(self.vertices[0] + self.vertices[2]) / 2
+
+    def translate(self, translation_vector):
+        self.vertices += translation_vector
+
+    def is_blocking_forwards(self, step=TRANSLATION_STEP):
+        """
+        Returns True if panel is blocking a forward movement of length step
+        """
+        depth = ray_intersection_depths(self.vertices[np.newaxis])[0]
+        return bool(0 < depth <= step)
+
+    def is_blocking_backwards(self, step=TRANSLATION_STEP):
+        """
+        Returns True if panel is blocking a backward movement of length step
+        """
+        depth = ray_intersection_depths(self.vertices[np.newaxis])[0]
+        return bool(0 > depth >= -step)
+
+
+class PanelIndex(object):
+    """
+    Maps (cell, axis) to the index of the panel in front of cell as
+    approached along axis, like a dict, but backed by an array indices of
+    shape (width + 1, height + 1, depth + 1, 3) holding -1 where there is
+    no panel.
+    """
+    def __init__(self, indices):
+        self.indices = indices
+
+    def get(self, key, default=None):
+        cell, axis = key
+        if all(0 <= cell[i] < self.indices.shape[i] for i in range(3)):
+            index = int(self.indices[cell[0], cell[1], cell[2], axis])
+            if index >= 0:
+                return index
+        return default
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        index = self.get(key)
+        if index is None:
+            raise KeyError(key)
+        return index
+
+    def __len__(self):
+        return int(np.count_nonzero(self.indices >= 0))
+
+
+class Maze(object):
+    def __init__(self, panel_list, goal_location, wall_index=None, dimensions=None):
+        corners = np.array([panel.vertices for panel in panel_list], dtype=float).reshape(-1, 3)
+        # Corners shared by several panels are stored only once
+        lattice_vertices, faces = np.unique(corners, axis=0, return_inverse=True)
+        colours = np.array([panel.colour for panel in panel_list], dtype=np.uint8).reshape(-1, 3)
+        self.setup(lattice_vertices, faces.reshape(-1, 4), colours, goal_location, wall_index, dimensions)
+
+    @classmethod
+    def from_mesh(cls, lattice_vertices, faces, colours, goal_location, wall_index=None, dimensions=None):
+        """
+        Creates a maze straight from an indexed mesh, without making panel
+        objects (see setup).
+        """
+        maze = cls.__new__(cls)
+        maze.setup(lattice_vertices, faces, colours, goal_location, wall_index, dimensions)
+        return maze
+
+    def setup(self, lattice_vertices, faces, colours, goal_location, wall_index, dimensions):
+        # The maze owns the world geometry of its panels as an indexed mesh:
+        # a (V, 3) array of vertices, each shared by all the panels it is a
+        # corner of, and an (N, 4) array giving the vertex numbers of the
+        # corners of each panel, with a parallel (N, 3) array of colours.
+        # The geometry stays static while the camera moves, and each vertex
+        # is transformed into view coordinates once when needed.
+        self.lattice_vertices = np.asarray(lattice_vertices, dtype=float).reshape(-1, 3)
+        self.faces = np.asarray(faces).reshape(-1, 4)
+        self.colours = np.asarray(colours, dtype=np.uint8).reshape(-1, 3)
+        # Centres of the panels, used for ordering them by distance
+        self.centres = (self.lattice_vertices[self.faces[:, 0]] + self.lattice_vertices[self.faces[:, 2]]) / 2
+        self.goal = Goal(np.array(goal_location, dtype=float))
+        # wall_index maps (cell, axis) to the index of the panel in front of
+        # cell as approached along axis, as a dict or a PanelIndex. When it
+        # is known, collisions only need to look at the walls around the
+        # player's cell.
+        self.wall_index = wall_index
+        # The (width, height, depth) of the grid of cells, if there is one
+        self.dimensions = dimensions
+        self.camera = Camera()
+        self._view_vertices = None
+        self._view_version = None
+
+    def rotate(self, rot_matrix):
+        self.camera.rotate(rot_matrix)
+
+    def translate(self, translation_vector):
+        self.camera.translate(translation_vector)
+
+    def view_vertices(self):
+        """
+        Returns the (N, 4, 3) array of panel vertices in view coordinates.
+        This is computed at most once for each state of the camera.
+        """
+        if self._view_version != self.camera.version:
+            self._view_vertices = self.camera.to_view(self.lattice_vertices)[self.faces]
+            self._view_version = self.camera.version
+        return self._view_vertices
+
+    def panel_view_vertices(self, indices):
+        """
+        Returns the (len(indices), 4, 3) array of the vertices of the panels
+        given by indices in view coordinates. Only those panels' corners are
+        transformed, so the cost grows with the number of panels seen rather
+        than the size of the maze.
+        """
+        return self.camera.to_view(self.lattice_vertices[self.faces[indices]])
+
+    def snapshot(self):
+        """
+        Returns a copy of the maze sharing its geometry but with its own
+        copy of the camera, which can be drawn while the camera moves on.
+        """
+        maze = copy.copy(self)
+        maze.camera = copy.copy(self.camera)
+        return maze
+
+    def view_goal(self):
+        """
+        Returns the goal as seen from the camera
+        """
+        return Goal(self.camera.to_view(self.goal.position))
+
+    def player_cell(self):
+        """
+        Returns the grid cell containing the camera
+        """
+        return tuple(int(coordinate) for coordinate in np.floor(self.camera.position + 0.5))
+
+    def nearby_panels(self, step):
+        """
+        Returns the indices of the panels which a movement of length step
+        along the view z axis could pass through.
+        """
+        start = self.camera.position
+        end = start + step * self.camera.orientation[:, 2]
+        # Any wall crossed by the movement is in front of one of the cells
+        # spanned by the start and end points.
+        low = np.floor(np.minimum(start, end) + 0.5).astype(int)
+        high = np.floor(np.maximum(start, end) + 0.5).astype(int)
+        indices = []
+        for cell in itertools.product(*(range(low[i], high[i] + 1) for i in range(3))):
+            for axis in range(3):
+                index = self.wall_index.get((cell, axis))
+                if index is not None:
+                    indices.append(index)
+        return indices
+
+    def collision_depths(self, step):
+        """
+        Returns the depths at which the view z axis passes through the
+        panels which a movement of length step could hit (see
+        ray_intersection_depths).
+        """
+        if self.wall_index is None:
+            return ray_intersection_depths(self.view_vertices())
+        nearby_vertices = self.lattice_vertices[self.faces[self.nearby_panels(step)]]
+        return ray_intersection_depths(self.camera.to_view(nearby_vertices))
+
+    def is_blocking_forwards(self, step=TRANSLATION_STEP):
+        """
+        Returns True if a forward movement of length step is blocked
+        """
+        depths = self.collision_depths(step)
+        return bool(np.any((0 < depths) & (depths <= step)))
+
+    def is_blocking_backwards(self, step=TRANSLATION_STEP):
+        """
+        Returns True if a backward movement of length step is blocked
+        """
+        depths = self.collision_depths(-step)
+        return bool(np.any((0 > depths) & (depths >= -step)))
+
+    def win(self):
+        return self.view_goal().win()
+
+    def in_grid(self, cell):
+        return all(0 <= cell[i] < self.dimensions[i] for i in range(3))
+
+    def outer_faces(self, camera_position):
+        """
+        Returns the faces on the outside of the grid which face the camera,
+        as (None, key, cell) tuples for the cell just inside each face.
+        """
+        faces = []
+        for axis in range(3):
+            if camera_position[axis] < -0.5:
+                layer, side = 0, 0
+            elif camera_position[axis] > self.dimensions[axis] - 0.5:
+                layer, side = self.dimensions[axis] - 1, 1
+            else:
+                continue
+            others = [range(self.dimensions[i]) if i != axis else [layer] for i in range(3)]
+            for cell in itertools.product(*others):
+                face_cell = list(cell)
+                face_cell[axis] += side
+                faces.append((None, (tuple(face_cell), axis), cell))
+        return faces
+
+    def portal_visibility(self):
+        """
+        Finds the panels which can be seen from the camera by walking from
+        the camera's cell through open faces, as long as the part of the
+        screen seen through them is not empty. When the camera is outside
+        the grid of cells, the walk starts from the outside faces of the
+        grid which face the camera.
+        Returns an array of the indices of the panels found and whether
+        the goal's cell was reached, or None if the maze has no grid.
+        """
+        if self.wall_index is None or self.dimensions is None:
+            return None
+        camera_cell = self.player_cell()
+        camera_position = self.camera.position
+        goal_cell = tuple(int(coordinate) for coordinate in np.round(self.goal.position))
+        visible_panels = []
+        goal_visible = False
+        # Each cell in a wave is paired with the rectangle of the screen
+        # through which it can be seen. Faces are only crossed away from
+        # the camera, so each step is one further from the camera's cell,
+        # and waves[distance] holds the cells at that many steps from it.
+        # Every cell is then reached in the same wave along every path.
+        waves = {}
+
+        def look_through(faces, regions):
+            # Adds the walls seen through the regions of the screen, and the
+            # cells beyond the open faces to their waves
+            face_vertices = np.array([PANEL_CORNERS[key[1]] + key[0] for _, key, _ in faces])
+            rectangles = screen_rectangles(self.camera.to_view(face_vertices))
+            for (cell, key, neighbour), rectangle in zip(faces, rectangles):
+                region = regions[cell]
+                overlap = np.concatenate((np.maximum(region[:2], rectangle[:2]),
+                                          np.minimum(region[2:], rectangle[2:])))
+                if overlap[0] >= overlap[2] or overlap[1] >= overlap[3]:
+                    continue
+                if key in self.wall_index:
+                    visible_panels.append(self.wall_index[key])
+                elif self.in_grid(neighbour):
+                    # The neighbour can be seen through this face. If it can
+                    # be seen through several faces, use a rectangle
+                    # containing all of them.
+                    wave = waves.setdefault(sum(abs(neighbour[i] - camera_cell[i]) for i in range(3)), {})
+                    if neighbour in wave:
+                        region = wave[neighbour]
+                        overlap = np.concatenate((np.minimum(region[:2], overlap[:2]),
+                                                  np.maximum(region[2:], overlap[2:])))
+                    wave[neighbour] = overlap
+
+        screen = np.array((0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        if self.in_grid(camera_cell):
+            waves[0] = {camera_cell: screen}
+        else:
+            faces = self.outer_faces(camera_position)
+            if faces:
+                look_through(faces, {None: screen})
+        while waves:
+            frontier = waves.pop(min(waves))
+            goal_visible = goal_visible or goal_cell in frontier
+            faces = []
+            for cell in frontier:
+                for axis in range(3):
+                    for side in (0, 1):
+                        face_cell = list(cell)
+                        face_cell[axis] += side
+                        # Only look at faces with the camera on this cell's side
+                        if (camera_position[axis] > face_cell[axis] - 0.5) != (side == 0):
+                            continue
+                        neighbour = list(cell)
+                        neighbour[axis] += 2 * side - 1
+                        faces.append((cell, (tuple(face_cell), axis), tuple(neighbour)))
+            if faces:
+                look_through(faces, frontier)
+        return np.array(visible_panels, dtype=int), goal_visible
+
+    def draw_order(self, indices=None):
+        """
+        Returns the indices of the panels sorted from furthest to closest,
+        together with the number of those panels which are further away
+        than the goal. If indices is given, only those panels are sorted.
+        """
+        if indices is None:
+            indices = np.arange(len(self.faces))
+        # Distances are unchanged by rotation, so they can be measured in
+        # world coordinates without transforming anything.
+        distances = np.linalg.norm(self.centres[indices] - self.camera.position, axis=1)
+        order = indices[np.argsort(distances)[::-1]]
+        goal_distance = np.linalg.norm(self.goal.position - self.camera.position)
+        return order, np.count_nonzero(distances > goal_distance)
+
+    def render(self, draw_polygon, draw_goal, profiler=_NO_PROFILER):
+        """
+        Renders the maze as seen from the camera, in screen coordinates,
+        by calling draw_polygon(colour, points) for each visible part of a
+        panel and draw_goal(centre, radius) for the goal, from back to front.
+        The stages are timed by profiler, if given.
+        """
+        # Only the panels found by walking through the open faces need to
+        # be drawn, unless the maze has no grid to walk through.
+        with profiler.stage("visibility"):
+            visibility = self.portal_visibility()
+        if visibility is None:
+            visible_panels, goal_visible = None, True
+        else:
+            visible_panels, goal_visible = visibility
+        with profiler.stage("sort"):
+            order, further_than_goal = self.draw_order(visible_panels)
+        with profiler.stage("transform"):
+            if visible_panels is None:
+                # Every panel is drawn, so transform the whole mesh once
+                view_vertices = self.view_vertices()[order]
+            else:
+                view_vertices = self.panel_view_vertices(order)
+        profiler.count("panels", len(order))
+        colours = self.colours[order]
+        render_panels(view_vertices[:further_than_goal], colours[:further_than_goal], draw_polygon, profiler)
+        with profiler.stage("draw"):
+            goal_circle = self.view_goal().screen_circle()
+            if goal_visible and goal_circle is not None:
+                draw_goal(*goal_circle)
+        render_panels(view_vertices[further_than_goal:], colours[further_than_goal:], draw_polygon, profiler)
+
+    def render_image(self, profiler=_NO_PROFILER):
+        """
+        Renders the maze as seen from the camera into an image with a depth
+        buffer (see rasterise_panels), which needs no sorting.
+        """
+        with profiler.stage("visibility"):
+            visibility = self.portal_visibility()
+        if visibility is None:
+            visible_panels, goal_visible = np.arange(len(self.faces)), True
+        else:
+            visible_panels, goal_visible = visibility
+        with profiler.stage("transform"):
+            if visibility is None:
+                view_vertices = self.view_vertices()
+            else:
+                view_vertices = self.panel_view_vertices(visible_panels)
+        profiler.count("panels", len(visible_panels))
+        goal_position = self.view_goal().position if goal_visible else None
+        return rasterise_panels(view_vertices, self.colours[visible_panels], goal_position, profiler)
+
+
+# CORNER_OFFSETS[index] gives the lattice points at the corners of the
+# panel in front of a cell, relative to the cell (see create_maze).
+CORNER_OFFSETS = (PANEL_CORNERS + 0.5).astype(int)
+
+
+def create_maze(width, height, depth, clear_steps, goal_position, start_position=None):
+    """
+    Creates a maze with the given dimensions and the given clear steps.
+    The player starts in the cell start_position if it is given, and
+    otherwise outside the maze in front of the cell (0, 0, 0).
+    """
+    # The corners of the cells lie on a lattice of points, where lattice
+    # point (i, j, k) is at (i - 0.5, j - 0.5, k - 0.5), so the panel in
+    # front of a cell as approached from the direction given by index has
+    # its corners at the lattice points cell + CORNER_OFFSETS[index].
+    lattice_shape = (width + 1, height + 1, depth + 1)
+    lattice_vertices = np.indices(lattice_shape).reshape(3, -1).T - 0.5
+    # present[i, j, k, index] is True if there is a panel in front of cell
+    # (i, j, k) as approached from the direction given by index. There is
+    # one in front of every cell except for the clear steps, and one behind
+    # each of the cells on the back edges.
+    present = np.zeros(lattice_shape + (3,), dtype=bool)
+    present[:width, :height, :depth] = True
+    clear = np.array([(*cell, index) for cell, index in clear_steps], dtype=int).reshape(-1, 4)
+    present[tuple(clear.T)] = False
+    for index in range(3):
+        back = [slice(width), slice(height), slice(depth), index]
+        back[index] = lattice_shape[index] - 1
+        present[tuple(back)] = True
+    panels = np.argwhere(present)
+    corners = panels[:, np.newaxis, :3] + CORNER_OFFSETS[panels[:, 3]]
+    faces = np.ravel_multi_index(tuple(np.moveaxis(corners, 2, 0)), lattice_shape)
+    wall_index = np.full(present.shape, -1)
+    wall_index[present] = np.arange(len(panels))
+    # The colours are seeded from random so that seeding random still
+    # determines the maze.
+    colours = np.random.default_rng(random.getrandbits(64)).integers(0, 256, (len(panels), 3))
+    maze = Maze.from_mesh(lattice_vertices, faces, colours, goal_position, PanelIndex(wall_index),
+                          (width, height, depth))
+    if start_position is None:
+        maze.translate(np.array((0, 0, 2)))
+    else:
+        maze.translate(-np.array(start_position))
+    return maze
+
+
+def predefined_maze():
+    clear_steps = [
+        ((0, 0, 0), 2),
+        ((0, 0, 1), 2),
+        ((0, 0, 2), 2),
+        ((0, 1, 2), 1),
+        ((1, 0, 2), 0),
+        ((1, 0, 0), 0),
+        ((2, 0, 0), 0),
+        ((2, 0, 1), 2),
+        ((2, 0, 2), 2),
+        ((0, 1, 1), 1),
+        ((0, 2, 1), 1),
+        ((0, 2, 2), 2),
+        ((1, 2, 2), 0),
+        ((1, 2, 2), 1),
+        ((0, 2, 1), 2),
+        ((1, 2, 0), 0),
+        ((1, 2, 0), 1),
+        ((1, 1, 0), 0),
+        ((1, 2, 1), 0),
+        ((2, 2, 1), 0),
+        ((2, 2, 1), 2),
+        ((2, 2, 0), 1),
+        ((2, 2, 2), 2),
+        ((2, 2, 2), 1),
+        ((2, 1, 2), 2),
+        ((2, 1, 1), 0),
+        ((1, 1, 1), 1)
+    ]
+    goal_position = np.array((1, 0, 1))
+    return create_maze(3, 3, 3, clear_steps, goal_position)
+
+
+def procedurally_generated_maze(width, height, depth, goal_in_opposite_corner,
+                                start_and_goal_on_diameter=False):
+    return create_maze(*procedurally_generated_layout(width, height, depth, goal_in_opposite_corner,
+                                                      start_and_goal_on_diameter))
+
+
+def procedurally_generated_layout(width, height, depth, goal_in_opposite_corner,
+                                  start_and_goal_on_diameter=False):
+    """
+    Generates the layout of a random maze, as the tuple of arguments
+    (width, height, depth, clear_steps, goal_position, start_position) to
+    pass to create_maze.
+    """
+    clear_steps = [((0, 0, 0), 2)]
+    # Cells are numbered by their position in the flattened grid, and the
+    # connected components are kept as disjoint sets of cells
+    strides = (height * depth, depth, 1)
+    components = DisjointSets(width * height * depth)
+    union = components.union
+    # Initialise array of panels. These are the panels we might knock down,
+    # numbered 3 * cell_number + index for the panel in front of a cell as
+    # approached from the direction given by index.
+    cell_numbers = np.arange(width * height * depth).reshape(width, height, depth)
+    panels = np.concatenate((3 * cell_numbers[1:, :, :].ravel(),
+                             3 * cell_numbers[:, 1:, :].ravel() + 1,
+                             3 * cell_numbers[:, :, 1:].ravel() + 2))
+    # Knocking panels down in a random order is the same as repeatedly
+    # choosing a random remaining panel. The shuffle is seeded from random
+    # so that seeding random still determines the maze.
+    np.random.default_rng(random.getrandbits(64)).shuffle(panels)
+    for panel in panels.tolist():
+        # number1 and number0 are the cells either side of the panel
+        number1, index = divmod(panel, 3)
+        number0 = number1 - strides[index]
+        if union(number0, number1):
+            # If the cells were in different connected components
+            # knock down the panel
+            cell1 = (number1 // strides[0], number1 // depth % height, number1 % depth)
+            clear_steps.append((cell1, index))
+    if start_and_goal_on_diameter:
+        # The player starts inside the maze, so the entrance is not needed
+        clear_steps = clear_steps[1:]
+        start_position, goal_position = maze_diameter(width, height, depth, clear_steps)
+        return width, height, depth, clear_steps, np.array(goal_position), start_position
+    if goal_in_opposite_corner:
+        goal_position = np.array((width-1, height-1, depth-1))
+    else:
+        # We now put the goal in the furthest place from the entrance
+        distances = maze_distances(width, height, depth, clear_steps, (0, 0, 0))
+        goal_position = np.array(np.unravel_index(np.argmax(distances), distances.shape))
+    return width, height, depth, clear_steps, goal_position, None
+
+
+def maze_adjacency(width, height, depth, clear_steps):
+    """
+    Builds adjacency arrays for the cells of a maze, numbered by their
+    position in the flattened grid. Returns a pair of lists (neighbours,
+    offsets) such that the cells joined to cell number n by a clear step
+    are neighbours[offsets[n]:offsets[n + 1]].
+    """
+    strides = (height * depth, depth, 1)
+    # Each clear step inside the grid joins two cells. Steps leading out of
+    # the grid, such as the entrance, are ignored.
+    edges = []
+    for cell1, index in clear_steps:
+        if cell1[index] > 0:
+            number1 = cell1[0] * strides[0] + cell1[1] * strides[1] + cell1[2]
+            edges.append((number1, number1 - strides[index]))
+    edges = np.array(edges, dtype=int).reshape(-1, 2)
+    starts = np.concatenate((edges[:, 0], edges[:, 1]))
+    ends = np.concatenate((edges[:, 1], edges[:, 0]))
+    neighbours = ends[np.argsort(starts, kind="stable")].tolist()
+    counts = np.bincount(starts, minlength=width * height * depth)
+    offsets = np.concatenate(([0], np.cumsum(counts))).tolist()
+    return neighbours, offsets
+
+
+def maze_distances(width, height, depth, clear_steps, source, adjacency=None):
+    """
+    Computes the number of steps from the cell source to every cell of
+    the maze, moving only through the clear steps, by a breadth first
+    search. Returns a (width, height, depth) array of distances, with -1
+    for cells which cannot be reached. adjacency can be passed in if it
+    has already been computed by maze_adjacency.
+    """
+    if adjacency is None:
+        adjacency = maze_adjacency(width, height, depth, clear_steps)
+    neighbours, offsets = adjacency
+    distances = [-1] * (width * height * depth)
+    source_number = (source[0] * height + source[1]) * depth + source[2]
+    distances[source_number] = 0
+    queue = [source_number]
+    # The queue grows while we iterate over it
+    for number in queue:
+        for neighbour in neighbours[offsets[number]:offsets[number + 1]]:
+            if distances[neighbour] < 0:
+                distances[neighbour] = distances[number] + 1
+                queue.append(neighbour)
+    return np.array(distances).reshape(width, height, depth)
+
+
+def maze_diameter(width, height, depth, clear_steps):
+    """
+    Finds two cells as far apart as possible in a maze whose clear steps
+    form a spanning tree, and returns them as a pair of tuples. The cell
+    furthest from any cell is one end of a longest path, and the cell
+    furthest from that is the other end.
+    """
+    adjacency = maze_adjacency(width, height, depth, clear_steps)
+    distances = maze_distances(width, height, depth, clear_steps, (0, 0, 0), adjacency)
+    first_end = np.unravel_index(np.argmax(distances), distances.shape)
+    distances = maze_distances(width, height, depth, clear_steps, first_end, adjacency)
+    second_end = np.unravel_index(np.argmax(distances), distances.shape)
+    return tuple(int(i) for i in first_end), tuple(int(i) for i in second_end)
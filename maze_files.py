@@ -0,0 +1,199 @@
+import mmap
+import struct
+from collections import namedtuple
+import numpy as np
+
+# A maze file is a header followed by the walls of the maze. The header
+# gives the dimensions, start and goal of the maze, the name of the
+# generator and the seed it was given, and the length of the walls that
+# follow, so that several mazes can be written one after another.
+MAGIC_2D = b"MZ2D"
+MAGIC_3D = b"MZ3D"
+VERSION = 1
+HEADER = struct.Struct("<4sHH3I3i3iQ16sQ")
+# Longest generator name in bytes that fits in the header
+GENERATOR_LENGTH = 16
+# Bits of the flags field of the header
+PACKED = 1
+HAS_SEED = 2
+HAS_START = 4
+
+MazeHeader = namedtuple("MazeHeader", ["magic", "packed", "dimensions", "start", "goal",
+                                       "generator", "seed", "payload_offset", "payload_length"])
+
+
+def write_maze(stream, magic, dimensions, bits, start, goal, generator=None, seed=None, packed=True):
+    """
+    Writes a maze to a binary stream.
+    :param stream: the stream to write to
+    :param magic: MAGIC_2D or MAGIC_3D
+    :param dimensions: width, height and depth of the maze, with a depth of
+    1 for 2D mazes
+    :param bits: array of 0s and 1s holding the walls
+    :param start: start position, or None if the maze has none
+    :param goal: goal position
+    :param generator: name of the generator of the maze, at most
+    GENERATOR_LENGTH bytes when encoded as UTF-8
+    :param seed: non-negative seed given to the generator, or None
+    :param packed: whether to pack the walls 8 to a byte. Otherwise they
+    are written a byte each, so that loading can use them in place.
+    """
+    generator = (generator or "").encode()
+    if len(generator) > GENERATOR_LENGTH:
+        raise ValueError("Generator name is longer than {} bytes".format(GENERATOR_LENGTH))
+    bits = np.asarray(bits, dtype=np.uint8)
+    if packed:
+        payload = np.packbits(bits.reshape(-1), bitorder="little").tobytes()
+    else:
+        payload = bits.tobytes()
+    flags = ((PACKED if packed else 0) | (HAS_SEED if seed is not None else 0)
+             | (HAS_START if start is not None else 0))
+    start = (0, 0, 0) if start is None else start
+    stream.write(HEADER.pack(magic, VERSION, flags, *dimensions, *start, *goal,
+                             0 if seed is None else seed, generator, len(payload)))
+    stream.write(payload)
+
+
+def read_header(buffer, offset=0):
+    """
+    Reads the header of the maze starting at offset in buffer.
+    :return: a MazeHeader. The next maze, if any, starts at
+    payload_offset + payload_length.
+    """
+    (magic, version, flags, width, height, depth, start_x, start_y, start_z, goal_x, goal_y, goal_z,
+     seed, generator, payload_length) = HEADER.unpack_from(buffer, offset)
+    if magic not in (MAGIC_2D, MAGIC_3D):
+        raise ValueError("Not a maze file")
+    if version != VERSION:
+        raise ValueError("Unsupported maze file version {}".format(version))
+    return MazeHeader(magic, bool(flags & PACKED), (width, height, depth),
+                      (start_x, start_y, start_z) if flags & HAS_START else None,
+                      (goal_x, goal_y, goal_z), generator.rstrip(b"\0").decode(),
+                      seed if flags & HAS_SEED else None, offset + HEADER.size, payload_length)
+
+
+def read_bits(buffer, header, shape):
+    """
+    Reads the walls of a maze from buffer, given its header. Unpacked walls
+    are returned as a view of buffer rather than a copy.
+    """
+    payload = np.frombuffer(buffer, dtype=np.uint8, count=header.payload_length,
+                            offset=header.payload_offset)
+    if header.packed:
+        payload = np.unpackbits(payload, count=int(np.prod(shape)), bitorder="little")
+    return payload.reshape(shape)
+
+
+def map_file(path):
+    """
+    Maps a file into memory read only, so that processes opening the same
+    file share one copy of it.
+    """
+    with open(path, "rb") as file:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def maze_offsets(buffer):
+    """
+    Finds the mazes written one after another to a buffer, such as a file
+    mapped by map_file.
+    :return: a list of the offsets at which they start, to pass to
+    read_header, load_maze2D or load_maze3D
+    """
+    offsets = []
+    offset = 0
+    while offset < len(buffer):
+        offsets.append(offset)
+        header = read_header(buffer, offset)
+        offset = header.payload_offset + header.payload_length
+    return offsets
+
+
+def save_maze2D(path, wall, goal_position, player_position=(0, 0), generator=None, seed=None,
+                packed=True):
+    """
+    Saves a 2D maze.
+    :param path: the file to write
+    :param wall: (height, width, 2) array holding the walls, as used by maze2D.Maze
+    :param goal_position: (column, row) of the goal
+    :param player_position: (column, row) the player starts at
+    :param generator: name of the generator of the maze
+    :param seed: seed given to the generator
+    :param packed: whether to pack the walls 8 to a byte
+    """
+    with open(path, "wb") as file:
+        write_maze2D(file, wall, goal_position, player_position, generator, seed, packed)
+
+
+def write_maze2D(stream, wall, goal_position, player_position=(0, 0), generator=None, seed=None,
+                 packed=True):
+    """
+    Writes a 2D maze to a binary stream, taking the same arguments as
+    save_maze2D after the path. Mazes can be written one after another.
+    """
+    height, width = np.shape(wall)[:2]
+    write_maze(stream, MAGIC_2D, (width, height, 1), wall, (*player_position, 0),
+               (*goal_position, 0), generator, seed, packed)
+
+
+def load_maze2D(path, offset=0):
+    """
+    Loads a 2D maze saved by save_maze2D, through a memory map.
+    :param path: the file to read
+    :param offset: where the maze starts in the file
+    :return: a tuple containing the width, the height, the wall, the goal
+    position and the player position, which are the arguments maze2D.Maze
+    takes after the canvas
+    """
+    buffer = map_file(path)
+    header = read_header(buffer, offset)
+    if header.magic != MAGIC_2D:
+        raise ValueError("Not a 2D maze")
+    width, height, _ = header.dimensions
+    wall = read_bits(buffer, header, (height, width, 2))
+    return width, height, wall, header.goal[:2], header.start[:2]
+
+
+def save_maze3D(path, width, height, depth, clear_steps, goal_position, start_position=None,
+                generator=None, seed=None, packed=True):
+    """
+    Saves a 3D maze, given by the arguments of maze3D_core.create_maze.
+    :param generator: name of the generator of the maze
+    :param seed: seed given to the generator
+    :param packed: whether to pack the walls 8 to a byte
+    """
+    with open(path, "wb") as file:
+        write_maze3D(file, width, height, depth, clear_steps, goal_position, start_position,
+                     generator, seed, packed)
+
+
+def write_maze3D(stream, width, height, depth, clear_steps, goal_position, start_position=None,
+                 generator=None, seed=None, packed=True):
+    """
+    Writes a 3D maze to a binary stream, taking the same arguments as
+    save_maze3D after the path. Mazes can be written one after another.
+    """
+    # clear[i, j, k, index] is 1 if the step (cell, index) is clear
+    clear = np.zeros((width, height, depth, 3), dtype=np.uint8)
+    for cell, index in clear_steps:
+        clear[cell][index] = 1
+    write_maze(stream, MAGIC_3D, (width, height, depth), clear, start_position, goal_position,
+               generator, seed, packed)
+
+
+def load_maze3D(path, offset=0):
+    """
+    Loads a 3D maze saved by save_maze3D, through a memory map.
+    :param path: the file to read
+    :param offset: where the maze starts in the file
+    :return: the tuple of arguments (width, height, depth, clear_steps,
+    goal_position, start_position) to pass to maze3D_core.create_maze
+    """
+    buffer = map_file(path)
+    header = read_header(buffer, offset)
+    if header.magic != MAGIC_3D:
+        raise ValueError("Not a 3D maze")
+    width, height, depth = header.dimensions
+    clear = read_bits(buffer, header, (width, height, depth, 3))
+    clear_steps = [((i, j, k), index) for i, j, k, index in np.argwhere(clear).tolist()]
+    return width, height, depth, clear_steps, np.array(header.goal), header.start